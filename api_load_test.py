@@ -0,0 +1,138 @@
+"""Load test for the local JSON API in covid_api.py.
+
+Opens keep-alive connections to a running server and sends a mix of
+requests over the dates and filter values for a fixed duration, then
+reports the request rate, latency percentiles and status codes:
+
+    python covid_api.py &
+    python api_load_test.py --connections 50 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections import Counter
+from urllib.parse import quote
+
+# Filter values polled by the simulated dashboards
+MIN_CASES = [100, 500, 1000, 5000, 10000]
+TESTING_THRESHOLDS = [5, 20, 50, 100]
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode('latin-1'))
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        return status, await self.reader.readexactly(length)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def request_paths(dates, countries, count, seed):
+    """Return ``count`` request paths drawn from the endpoint mix."""
+    rng = random.Random(seed)
+    paths = []
+    for _ in range(count):
+        kind = rng.random()
+        date = rng.choice(dates)
+        if kind < 0.5:
+            paths.append(f"/estimate?date={date}&min_cases={rng.choice(MIN_CASES)}"
+                         f"&testing_threshold={rng.choice(TESTING_THRESHOLDS)}")
+        elif kind < 0.8:
+            paths.append(f"/dates/{date}/countries?min_cases={rng.choice(MIN_CASES)}")
+        elif kind < 0.95:
+            paths.append(f"/countries/{quote(rng.choice(countries))}/series")
+        else:
+            paths.append("/dates")
+    return paths
+
+
+async def worker(client, paths, deadline, latencies, statuses):
+    i = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        status, _ = await client.get(paths[i % len(paths)])
+        latencies.append(time.perf_counter() - start)
+        statuses[status] += 1
+        i += 1
+
+
+async def run(args):
+    setup = Client(args.host, args.port)
+    _, body = await setup.get('/dates')
+    dates = json.loads(body)['dates']
+    _, body = await setup.get('/countries')
+    countries = json.loads(body)['countries']
+    setup.close()
+
+    clients = [Client(args.host, args.port) for _ in range(args.connections)]
+    latencies = []
+    statuses = Counter()
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            worker(client, request_paths(dates, countries, args.paths, args.seed + i),
+                   start + args.duration, latencies, statuses)
+            for i, client in enumerate(clients)))
+    finally:
+        for client in clients:
+            client.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(latencies)} requests over {args.connections} connections in {elapsed:.1f} s: "
+          f"{len(latencies) / elapsed:,.0f} requests/s")
+    if len(latencies) > 1:
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f"Latency: p50 {1000 * quantiles[49]:.2f} ms, p90 {1000 * quantiles[89]:.2f} ms, "
+              f"p99 {1000 * quantiles[98]:.2f} ms, max {1000 * max(latencies):.2f} ms")
+    print("Status codes: " + ', '.join(f"{status} x {count}" for status, count in sorted(statuses.items())))
+
+    stats = Client(args.host, args.port)
+    _, body = await stats.get('/stats')
+    stats.close()
+    cache = json.loads(body)['cache']
+    print(f"Server cache: {cache['hits']} hits, {cache['misses']} misses, "
+          f"{cache['size']}/{cache['maxsize']} entries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="Server address (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=8000,
+                        help="Server port (default: %(default)s)")
+    parser.add_argument('--connections', type=int, default=20,
+                        help="Concurrent keep-alive connections (default: %(default)s)")
+    parser.add_argument('--duration', type=float, default=10,
+                        help="Seconds to send requests for (default: %(default)s)")
+    parser.add_argument('--paths', type=int, default=500,
+                        help="Distinct request paths per connection (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed for the request mix (default: %(default)s)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,21 @@
 import streamlit as st
-import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime
 import altair as alt
 
+from covid_data import DATA_FILE, DERIVED_COLUMNS, SnapshotIndex
+from covid_cache import LRUCache, PlotCache
+from covid_plots import histogram_png, plot_cache_dir
+from covid_stats import CountryTimeSeries, DeathRateQuery, threshold_sweep
+from covid_timing import ProfileDump, StageTimer
+
+# Number of per-parameter results kept for all sessions
+RESULT_CACHE_SIZE = 256
+
+# Opt-in instrumentation: COVID_TIMING=1 times each stage of this run and
+# COVID_PROFILE=path writes a cProfile dump of the latest run
+timer = StageTimer('dashboard_run')
+
 # Set page title and favicon
 st.set_page_config(
     page_title="COVID-19 Death Rate Analysis",
@@ -15,91 +26,47 @@ st.set_page_config(
 st.title("COVID-19 Death Rate Analysis")
 st.markdown("Analyzing the relationship between testing quality and reported death rates")
 
-# Load data
-@st.cache_data
+# Load data once per server, index its rows by date and compute derived metrics
+@st.cache_resource
 def load_data():
-    return pd.read_csv('worldometer_snapshots_April18_to_May18.csv')
-
-# Load data with a progress indicator
-with st.spinner('Loading data...'):
-    worldometer_df = load_data()
-
-# Sidebar filters
-st.sidebar.header("Filters")
-
-# Date filter
-available_dates = sorted(worldometer_df['Date'].unique().tolist())
-selected_date = st.sidebar.selectbox(
-    "Select Date", 
-    available_dates,
-    index=len(available_dates)-1  # Default to the last date
-)
+    return SnapshotIndex.from_csv()
 
-# Case threshold filter
-min_cases_threshold = st.sidebar.slider("Minimum Cases Threshold", 
-                                       min_value=100, 
-                                       max_value=10000, 
-                                       value=1000,
-                                       step=100)
+# Per-date threshold query structures, shared by all sessions
+@st.cache_resource
+def load_death_rate_query():
+    return DeathRateQuery(load_data())
 
-# Testing quality threshold filter
-testing_quality_threshold = st.sidebar.slider("Testing Quality Threshold (tests per positive case)", 
-                                            min_value=5, 
-                                            max_value=100, 
-                                            value=50,
-                                            step=5)
+# Country x date time series, built once per server
+@st.cache_resource
+def load_time_series():
+    return CountryTimeSeries.from_snapshots(load_data())
 
-# Filter data based on selected date
-date_df = worldometer_df.loc[worldometer_df['Date'] == selected_date, :].reset_index(drop=True)
+# Per-parameter results, shared by all sessions with LRU eviction
+@st.cache_resource
+def load_result_cache():
+    return LRUCache(maxsize=RESULT_CACHE_SIZE)
 
-# Main content area
-st.header(f"Data for {selected_date}")
+# Rendered plots keyed by their data, shared with the script through the disk cache
+@st.cache_resource
+def load_plot_cache():
+    return PlotCache(plot_cache_dir(DATA_FILE))
 
-# Display raw data if checkbox is selected
-if st.checkbox("Show raw data"):
-    st.dataframe(date_df)
+def render_histogram_png(filtered_df):
+    # Reused across sessions, restarts and result cache evictions
+    return histogram_png(filtered_df, 'Histogram of Death Rates', load_plot_cache(), bbox_inches='tight',
+                         figsize=(10, 6), label_size=14, title_size=16)
 
-# Calculate death rate
-date_df['Case Fatality Ratio'] = date_df['Total Deaths'] / date_df['Total Cases']
-date_df['Num Tests per Positive Case'] = date_df['Total Tests'] / date_df['Total Cases']
-
-# Filter countries by case threshold
-filtered_df = date_df.loc[date_df['Total Cases'] > min_cases_threshold, :].copy()
-st.write(f"Countries with more than {min_cases_threshold} cases: {len(filtered_df)}")
-
-# Create two columns for charts
-col1, col2 = st.columns(2)
-
-with col1:
-    st.subheader("Death Rate Histogram")
-    
-    # Create histogram using matplotlib
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.hist(100 * np.array(filtered_df['Case Fatality Ratio']), bins=np.arange(35))
-    ax.set_xlabel('Death Rate (%)', fontsize=14)
-    ax.set_ylabel('Number of Countries', fontsize=14)
-    ax.set_title('Histogram of Death Rates', fontsize=16)
-    st.pyplot(fig)
-
-with col2:
-    st.subheader("Testing Quality vs Death Rate")
-    
-    # Calculate parameters for scatter plot
-    x_axis_limit = 80
-    
-    chart_df = filtered_df.copy()
-    chart_df['Death Rate (%)'] = 100 * chart_df['Case Fatality Ratio']
-    chart_df['Tests Per Case'] = chart_df['Num Tests per Positive Case'].copy()
-    chart_df.loc[chart_df['Tests Per Case'] > x_axis_limit, 'Tests Per Case'] = x_axis_limit
-    chart_df['log_population'] = np.log(1 + chart_df['Population'])
-    chart_df['log_deaths'] = np.log10(1 + chart_df['Total Deaths'])
+def build_scatter_chart(filtered_df):
+    # Only the columns the chart uses; tests per case is already clipped for plotting
+    chart_df = filtered_df[['Country', 'Death Rate (%)', 'Tests Per Case', 'Total Cases',
+                            'Total Deaths', 'Log Population', 'Log Deaths']]
     
     # Create scatter plot using Altair
     scatter = alt.Chart(chart_df).mark_circle().encode(
         x=alt.X('Tests Per Case', title='Number of Tests per Positive Case'),
         y=alt.Y('Death Rate (%)', scale=alt.Scale(domain=[-0.2, 17])),
-        size=alt.Size('log_population', legend=None),
-        color=alt.Color('log_deaths', legend=None),
+        size=alt.Size('Log Population', legend=None),
+        color=alt.Color('Log Deaths', legend=None),
         tooltip=['Country', 'Death Rate (%)', 'Tests Per Case', 'Total Cases', 'Total Deaths']
     ).properties(
         height=400
@@ -116,44 +83,227 @@ with col2:
         y='Death Rate (%)',
         text='Country'
     )
+    return scatter + text
+
+def show_country_trends():
+    time_series = load_time_series()
+    time_series.sync(snapshots)
+    st.header("Country Trends")
+    countries = list(time_series.countries)
+    country = st.sidebar.selectbox("Country", countries,
+                                   index=countries.index('USA') if 'USA' in countries else 0)
+    
+    # Every metric is precomputed for all countries, so this is a row lookup
+    country_df = time_series.country_frame(country)
+    
+    st.subheader("Daily New Cases and Deaths")
+    st.line_chart(country_df[['New Cases', 'New Deaths']])
     
-    st.altair_chart(scatter + text, use_container_width=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader(f"Rolling {time_series.window}-Day Case Fatality Ratio (%)")
+        st.line_chart(country_df[['Rolling CFR (%)']])
+    with col2:
+        st.subheader("Tests per Positive Case")
+        st.line_chart(country_df[['Tests per Positive Case', 'Rolling Tests per Positive']])
+    
+    if st.checkbox("Show time series data"):
+        st.dataframe(country_df)
 
-# Good testing countries section
-st.header("Analysis of Countries with Good Testing")
-good_testing_df = filtered_df.loc[filtered_df['Num Tests per Positive Case'] > testing_quality_threshold, :].copy()
+def show_timings(**context):
+    # Stage timings of this run, with a JSON lines export when configured
+    if not timer.enabled:
+        return
+    with st.sidebar.expander("Stage timings"):
+        st.table(pd.DataFrame({'ms': timer.as_dict()}).mul(1000).round(2))
+        st.caption(f"Total: {1000 * timer.total:.1f} ms")
+    timer.record(page=page, **context)
 
-st.write(f"Countries with testing quality > {testing_quality_threshold} tests per positive case: {len(good_testing_df)}")
+def compute_chart_results(date, min_cases):
+    # Everything that depends only on the date and the case threshold
+    date_df = snapshots.get_date(date)
+    filtered_df = date_df.loc[date_df['Total Cases'] > min_cases, :]
+    return {
+        'num_filtered': len(filtered_df),
+        'histogram_png': render_histogram_png(filtered_df),
+        'scatter_chart': build_scatter_chart(filtered_df),
+    }
 
-# Display table of good testing countries
-if not good_testing_df.empty:
-    st.dataframe(good_testing_df[['Country', 'Total Cases', 'Total Deaths', 'Total Tests', 
-                               'Num Tests per Positive Case', 'Case Fatality Ratio']]
+def compute_good_testing_results(date, min_cases, testing_threshold):
+    date_df = snapshots.get_date(date)
+    good_testing_df = date_df.loc[(date_df['Total Cases'] > min_cases) &
+                                  (date_df['Num Tests per Positive Case'] > testing_threshold), :]
+    table_df = (good_testing_df[['Country', 'Total Cases', 'Total Deaths', 'Total Tests',
+                                 'Num Tests per Positive Case', 'Case Fatality Ratio']]
                 .sort_values(by='Num Tests per Positive Case', ascending=False)
-                .reset_index(drop=True)
-                .style.format({
-                    'Case Fatality Ratio': '{:.4f}',
-                    'Num Tests per Positive Case': '{:.2f}'
-                }))
-    
-    # Calculate the estimated death rate for good testing countries
-    if good_testing_df['Total Cases'].sum() > 0:  # Avoid division by zero
-        estimated_death_rate = 100 * good_testing_df['Total Deaths'].sum() / good_testing_df['Total Cases'].sum()
-        
-        st.metric(
-            label="Estimated COVID-19 Death Rate (countries with good testing)", 
-            value=f"{estimated_death_rate:.2f}%"
-        )
-        
-        st.markdown("""
-        ### Conclusion
-        
-        This analysis suggests that differences in testing strategies significantly impact the reported death rates across countries.
-        Countries with better testing tend to have more consistent and lower death rates.
-        """)
-else:
-    st.write("No countries meet the selected testing quality threshold. Try adjusting the filters.")
-
-# Add footer with data source information
-st.markdown("---")
-st.markdown("Data source: Worldometer COVID-19 data from April 18 to May 18, 2020") 
\ No newline at end of file
+                .reset_index(drop=True))
+    return {
+        'table_df': table_df,
+        'estimate': death_rate_query.estimate(date, min_cases, testing_threshold),
+        'interval': death_rate_query.confidence_interval(date, min_cases, testing_threshold),
+    }
+
+def build_sweep_chart(date):
+    # Estimate over every slider combination for the date
+    sweep_df = threshold_sweep(snapshots, [date]).to_frame()
+    return alt.Chart(sweep_df).mark_rect().encode(
+        x=alt.X('Testing Threshold:O', title='Testing Quality Threshold'),
+        y=alt.Y('Min Cases:O', title='Minimum Cases', sort='descending',
+                axis=alt.Axis(values=list(range(1000, 10001, 1000)))),
+        color=alt.Color('Estimated Death Rate (%):Q', scale=alt.Scale(scheme='viridis')),
+        tooltip=['Min Cases', 'Testing Threshold', 'Good Testing Countries',
+                 alt.Tooltip('Estimated Death Rate (%)', format='.2f')]
+    ).properties(
+        height=500
+    )
+
+def sweep_marker(min_cases, testing_threshold):
+    # Outline the cell of the current slider position
+    return alt.Chart(pd.DataFrame({'Min Cases': [min_cases], 'Testing Threshold': [testing_threshold]})).mark_rect(
+        fillOpacity=0, stroke='red', strokeWidth=2
+    ).encode(
+        x='Testing Threshold:O',
+        y=alt.Y('Min Cases:O', sort='descending')
+    )
+
+# The profile is written however the run ends: normally, through st.stop(),
+# or when a rerun or an exception interrupts it
+with ProfileDump():
+    # Load data with a progress indicator
+    with st.spinner('Loading data...'), timer.span('load'):
+        snapshots = load_data()
+        worldometer_df = snapshots.df
+        death_rate_query = load_death_rate_query()
+        result_cache = load_result_cache()
+
+        # Pick up days appended to the CSV since it was loaded (cheap when unchanged).
+        # A file that cannot be read right now leaves the loaded data in use.
+        try:
+            snapshots.refresh()
+        except (OSError, ValueError) as e:
+            st.warning(f"Could not load new data: {e}")
+
+    # Page selection
+    page = st.sidebar.radio("Page", ["Death Rate Analysis", "Country Trends"])
+    if page == "Country Trends":
+        with timer.span('trends'):
+            show_country_trends()
+        show_timings()
+        st.stop()
+
+    # Sidebar filters
+    st.sidebar.header("Filters")
+
+    # Date filter
+    available_dates = list(snapshots.dates)
+    selected_date = st.sidebar.selectbox(
+        "Select Date", 
+        available_dates,
+        index=len(available_dates)-1  # Default to the last date
+    )
+
+    # Case threshold filter
+    min_cases_threshold = st.sidebar.slider("Minimum Cases Threshold", 
+                                           min_value=100, 
+                                           max_value=10000, 
+                                           value=1000,
+                                           step=100)
+
+    # Testing quality threshold filter
+    testing_quality_threshold = st.sidebar.slider("Testing Quality Threshold (tests per positive case)", 
+                                                min_value=5, 
+                                                max_value=100, 
+                                                value=50,
+                                                step=5)
+
+    # Look up the rows for the selected date (derived metrics are precomputed)
+    with timer.span('filter'):
+        date_df = snapshots.get_date(selected_date)
+    raw_columns = [col for col in worldometer_df.columns if col not in DERIVED_COLUMNS]
+
+    # Main content area
+    st.header(f"Data for {selected_date}")
+
+    # Display raw data if checkbox is selected
+    if st.checkbox("Show raw data"):
+        st.dataframe(date_df[raw_columns])
+
+    # Results for these parameters, computed once and shared across sessions
+    with timer.span('charts'):
+        chart_results = result_cache.get_or_compute(
+            ('charts', snapshots.generation, selected_date, min_cases_threshold),
+            lambda: compute_chart_results(selected_date, min_cases_threshold))
+    with timer.span('good_testing'):
+        good_testing_results = result_cache.get_or_compute(
+            ('good_testing', snapshots.generation, selected_date, min_cases_threshold, testing_quality_threshold),
+            lambda: compute_good_testing_results(selected_date, min_cases_threshold, testing_quality_threshold))
+
+    st.write(f"Countries with more than {min_cases_threshold} cases: {chart_results['num_filtered']}")
+
+    # Create two columns for charts
+    col1, col2 = st.columns(2)
+
+    with col1, timer.span('show_histogram'):
+        st.subheader("Death Rate Histogram")
+        st.image(chart_results['histogram_png'], use_column_width=True)
+
+    with col2, timer.span('show_scatter'):
+        st.subheader("Testing Quality vs Death Rate")
+        st.altair_chart(chart_results['scatter_chart'], use_container_width=True)
+
+    # Good testing countries section
+    st.header("Analysis of Countries with Good Testing")
+    table_df = good_testing_results['table_df']
+
+    st.write(f"Countries with testing quality > {testing_quality_threshold} tests per positive case: {len(table_df)}")
+
+    # Display table of good testing countries
+    if not table_df.empty:
+        with timer.span('show_table'):
+            st.dataframe(table_df.style.format({
+                            'Case Fatality Ratio': '{:.4f}',
+                            'Num Tests per Positive Case': '{:.2f}'
+                        }))
+
+        # Show the estimated death rate for good testing countries
+        estimate = good_testing_results['estimate']
+        interval = good_testing_results['interval']
+        if estimate.cases > 0:  # Avoid division by zero
+            st.metric(
+                label="Estimated COVID-19 Death Rate (countries with good testing)", 
+                value=f"{estimate.death_rate:.2f}%",
+                help=f"Percentile bootstrap over the {estimate.countries} countries "
+                     f"with {interval.resamples} resamples"
+            )
+            st.caption(f"{interval.confidence:.0%} confidence interval: {interval.low:.2f}% to {interval.high:.2f}%")
+
+            st.markdown("""
+            ### Conclusion
+
+            This analysis suggests that differences in testing strategies significantly impact the reported death rates across countries.
+            Countries with better testing tend to have more consistent and lower death rates.
+            """)
+    else:
+        st.write("No countries meet the selected testing quality threshold. Try adjusting the filters.")
+
+    # Sensitivity of the estimate to both thresholds
+    st.header("Threshold Sensitivity")
+    st.write("Estimated death rate for every combination of the two thresholds on this date. "
+             "The outlined cell is the current selection; empty cells have no good testing countries.")
+    with timer.span('sweep'):
+        sweep_chart = result_cache.get_or_compute(
+            ('sweep', snapshots.generation, selected_date),
+            lambda: build_sweep_chart(selected_date))
+    with timer.span('show_sweep'):
+        st.altair_chart(sweep_chart + sweep_marker(min_cases_threshold, testing_quality_threshold),
+                        use_container_width=True)
+
+    # Result cache counters (shared by all sessions on this server)
+    cache_stats = result_cache.stats()
+    st.sidebar.caption(f"Result cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                       f"{cache_stats['size']}/{cache_stats['maxsize']} entries")
+    show_timings(date=selected_date, min_cases=min_cases_threshold, testing_threshold=testing_quality_threshold)
+
+    # Add footer with data source information
+    st.markdown("---")
+    st.markdown("Data source: Worldometer COVID-19 data from April 18 to May 18, 2020") 
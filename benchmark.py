@@ -0,0 +1,326 @@
+"""Benchmarks for loading, filtering, metrics, estimates and rendering.
+
+Synthetic snapshot files with the same schema as the bundled CSV are
+generated at several multiples of its size, and every stage is timed on
+each of them. Results are written as JSON so runs can be compared:
+
+    python benchmark.py --scales 1,10,100,1000 --output benchmark_results.json
+    python benchmark.py --scales 1,10 --compare benchmark_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+from unittest import mock
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from covid_data import (COUNT_COLUMNS, DATA_FILE, SnapshotIndex, add_derived_metrics, load_snapshots,
+                        memory_report, write_snapshot_cache)
+from covid_cache import PlotCache
+from covid_plots import histogram_figure, histogram_png, scatter_figure, scatter_png
+from covid_stats import DeathRateQuery, threshold_sweep
+
+def generate_snapshots(scale, source=DATA_FILE, seed=0):
+    """Return a synthetic snapshot table ``scale`` times the size of ``source``.
+
+    Every country is replicated ``scale`` times as sub-national style regions
+    ("USA #1", "USA #2", ...). Each replica multiplies all of its counts by
+    one random factor, so the cumulative series stay consistent over time
+    and missing values stay missing.
+    """
+    base = pd.read_csv(source)
+    base = base.sort_values('Date', kind='stable').reset_index(drop=True)
+    rng = np.random.default_rng(seed)
+    country_codes, countries = pd.factorize(base['Country'])
+    factors = rng.lognormal(0, 0.5, size=(len(countries), scale))
+    factors[:, 0] = 1.0
+
+    # Row order: for each date, every replica of every country on that date
+    dates = base['Date'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])
+    bounds = np.r_[starts, len(dates)]
+    rows, replicas = [], []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        block = np.arange(start, stop)
+        rows.append(np.tile(block, scale))
+        replicas.append(np.repeat(np.arange(scale), len(block)))
+    rows = np.concatenate(rows)
+    replicas = np.concatenate(replicas)
+
+    df = base.iloc[rows].reset_index(drop=True)
+    names = df['Country'].to_numpy(dtype=object)
+    suffix = np.char.add(' #', replicas.astype(str)).astype(object)
+    df['Country'] = np.where(replicas == 0, names, names + suffix)
+    row_factors = factors[country_codes[rows], replicas]
+    for name in COUNT_COLUMNS:  # Every count is scaled for the region
+        df[name] = np.round(df[name].to_numpy(dtype=float) * row_factors)
+    df['Population'] = df['Population'].astype(np.int64)
+    return df
+
+
+def synthetic_file(scale, data_dir, seed=0):
+    """Write (or reuse) the synthetic CSV for ``scale`` and return its path."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'snapshots_x{scale}.csv')
+    if not os.path.exists(path):
+        print(f"  generating {path}...")
+        generate_snapshots(scale, seed=seed).to_csv(path, index=False)
+    return path
+
+
+def timeit(function, repeat):
+    """Run ``function`` ``repeat`` times and return timing statistics in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {
+        'runs': repeat,
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'mean_s': statistics.fmean(times),
+    }
+
+
+def _render_png(fig):
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+class _Var:
+    # Stand-in for tkinter variables when no display is available
+    def __init__(self, master=None, value=None, **kwargs):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class _HeadlessCanvas(FigureCanvasAgg):
+    # FigureCanvasTkAgg replacement that renders with Agg and has no widget
+    def __init__(self, figure, master=None):
+        super().__init__(figure)
+        self._widget = mock.MagicMock()
+
+    def get_tk_widget(self):
+        return self._widget
+
+    def draw_idle(self, *args, **kwargs):
+        self.draw()
+
+
+def _combobox(master=None, textvariable=None, values=(), **kwargs):
+    widget = mock.MagicMock()
+    widget.current.side_effect = lambda index: textvariable.set(values[index])
+    return widget
+
+
+def make_gui_app(path, tk_mode='auto'):
+    """Return (app, flush) for a CovidAnalysisApp on ``path``.
+
+    With a display the real Tk widgets are used with a withdrawn window;
+    otherwise Tk is replaced by stubs and figures are drawn with Agg.
+    ``flush`` processes pending drawing so an update cycle is fully timed.
+    The data is loaded before returning and the first tab is selected, so
+    an update cycle renders that tab only, as it does for a user.
+    """
+    import tkinter as tk
+    import simple_gui
+
+    if tk_mode in ('auto', 'real'):
+        try:
+            root = tk.Tk()
+            root.withdraw()
+            app = simple_gui.CovidAnalysisApp(root, data_file=path)
+            app.finish_loading()
+            return app, root.update
+        except tk.TclError:
+            if tk_mode == 'real':
+                raise
+
+    patches = [
+        mock.patch.object(simple_gui, 'ttk', mock.MagicMock(Combobox=mock.MagicMock(side_effect=_combobox))),
+        mock.patch.object(simple_gui, 'FigureCanvasTkAgg', _HeadlessCanvas),
+        mock.patch.object(simple_gui.tk, 'StringVar', _Var),
+        mock.patch.object(simple_gui.tk, 'IntVar', _Var),
+    ]
+    for patch in patches:
+        patch.start()
+    app = simple_gui.CovidAnalysisApp(mock.MagicMock(), data_file=path)
+    app.notebook.index.return_value = simple_gui.HISTOGRAM_TAB
+    app.finish_loading()
+    return app, lambda: None
+
+
+def benchmark_scale(scale, path, repeat, tk_mode):
+    results = {}
+
+    # Loading: raw CSV parse, then the binary cache when warm
+    results['csv_load'] = timeit(lambda: load_snapshots(path, use_cache=False), repeat)
+    write_snapshot_cache(load_snapshots(path, use_cache=False), path)
+    results['cache_load'] = timeit(lambda: load_snapshots(path), repeat)
+
+    df = load_snapshots(path)
+    results['derived_metrics'] = timeit(lambda: add_derived_metrics(df.copy()), repeat)
+    snapshots = SnapshotIndex(df.copy(), source=path, source_size=os.path.getsize(path))
+    rows = len(snapshots.df)
+    dates = snapshots.dates
+    last_date = dates[-1]
+
+    # Per-date filtering: boolean scan against the date index, over all dates
+    raw_df = snapshots.df
+    results['date_filter_scan'] = timeit(
+        lambda: [raw_df.loc[raw_df['Date'] == date, :] for date in dates], repeat)
+    results['date_filter_index'] = timeit(
+        lambda: [snapshots.get_date(date) for date in dates], repeat)
+
+    # Good-testing estimate: two pandas filters against the query engine
+    def pandas_estimate(min_cases=1000, threshold=50):
+        date_df = snapshots.get_date(last_date)
+        filtered_df = date_df.loc[date_df['Total Cases'] > min_cases, :]
+        good_df = filtered_df.loc[filtered_df['Num Tests per Positive Case'] > threshold, :]
+        return 100 * good_df['Total Deaths'].sum() / good_df['Total Cases'].sum()
+
+    query = DeathRateQuery(snapshots)
+    results['estimate_pandas'] = timeit(pandas_estimate, repeat)
+    results['estimate_query_build'] = timeit(
+        lambda: (query.invalidate(last_date), query.estimate(last_date, 1000, 50)), repeat)
+    results['estimate_query'] = timeit(lambda: query.estimate(last_date, 1000, 50), repeat)
+
+    # Full threshold sweep: per-cell pandas filters against the binned cumulative sums
+    def pandas_sweep(min_cases_grid=range(100, 10001, 500), thresholds=range(5, 101, 5)):
+        with np.errstate(invalid='ignore'):  # Cells without good testing countries
+            return [pandas_estimate(min_cases, threshold)
+                    for min_cases in min_cases_grid for threshold in thresholds]
+
+    results['sweep_pandas_coarse'] = timeit(pandas_sweep, repeat)
+    results['sweep_last_date'] = timeit(lambda: threshold_sweep(snapshots, [last_date]), repeat)
+    results['sweep_all_dates'] = timeit(lambda: threshold_sweep(snapshots), repeat)
+
+    # Rendering with Agg
+    date_df = snapshots.get_date(last_date)
+    filtered_df = date_df.loc[date_df['Total Cases'] > 1000, :]
+    results['render_histogram'] = timeit(
+        lambda: _render_png(histogram_figure(filtered_df, 'Histogram of Death Rates')), repeat)
+    results['render_scatter'] = timeit(
+        lambda: _render_png(scatter_figure(filtered_df, ['USA', 'Italy', 'Germany'])), repeat)
+
+    # Warm plot cache: hashing the plotted columns replaces the rendering
+    plot_cache = PlotCache()
+    histogram_png(filtered_df, 'Histogram of Death Rates', plot_cache)
+    scatter_png(filtered_df, ['USA', 'Italy', 'Germany'], plot_cache)
+    results['render_histogram_cached'] = timeit(
+        lambda: histogram_png(filtered_df, 'Histogram of Death Rates', plot_cache), repeat)
+    results['render_scatter_cached'] = timeit(
+        lambda: scatter_png(filtered_df, ['USA', 'Italy', 'Germany'], plot_cache), repeat)
+
+    # Full GUI update cycle: compute on this thread, then apply and draw
+    app, flush = make_gui_app(path, tk_mode)
+
+    def update_cycle():
+        app._request_id += 1
+        results_ = app._compute_analysis(app._request_id, last_date, 1000, 50)
+        app._show_results(results_)
+        flush()
+
+    results['gui_update_cycle'] = timeit(update_cycle, repeat)
+    app._executor.shutdown(wait=False)
+    mock.patch.stopall()
+
+    # Memory of the plain read_csv table against the typed one
+    report = memory_report(path)
+    memory = {'plain_bytes': int(report['plain'].sum()), 'typed_bytes': int(report['typed'].sum())}
+
+    return {'scale': scale, 'rows': rows, 'dates': len(dates), 'memory': memory, 'benchmarks': results}
+
+
+def compare(current, previous):
+    # Print median time ratios against an earlier results file
+    old = {(run['scale'], name): stats['median_s']
+           for run in previous['runs'] for name, stats in run['benchmarks'].items()}
+    print(f"\n{'scale':>6} {'benchmark':<24} {'before (ms)':>12} {'after (ms)':>12} {'ratio':>7}")
+    for run in current['runs']:
+        for name, stats in run['benchmarks'].items():
+            before = old.get((run['scale'], name))
+            if before is None:
+                continue
+            after = stats['median_s']
+            ratio = after / before if before else float('nan')
+            print(f"{run['scale']:>6} {name:<24} {1000 * before:>12.3f} {1000 * after:>12.3f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the COVID-19 analysis pipeline")
+    parser.add_argument('--scales', default='1,10,100,1000',
+                        help="Comma-separated multiples of the bundled CSV size (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Runs per benchmark (default: %(default)s)")
+    parser.add_argument('--data-dir', default='bench_data',
+                        help="Where synthetic CSVs are generated and reused (default: %(default)s)")
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help="JSON results file (default: %(default)s)")
+    parser.add_argument('--compare', metavar='RESULTS_JSON',
+                        help="Earlier results file to compare against")
+    parser.add_argument('--tk', choices=['auto', 'real', 'stub'], default='auto',
+                        help="Use a real (withdrawn) Tk window or stubs for the GUI cycle")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed for the synthetic data (default: %(default)s)")
+    parser.add_argument('--generate-only', action='store_true',
+                        help="Only write the synthetic CSVs")
+    args = parser.parse_args()
+    scales = [int(scale) for scale in args.scales.split(',')]
+
+    runs = []
+    for scale in scales:
+        print(f"Scale x{scale}")
+        path = synthetic_file(scale, args.data_dir, seed=args.seed)
+        if args.generate_only:
+            continue
+        run = benchmark_scale(scale, path, args.repeat, args.tk)
+        for name, stats in run['benchmarks'].items():
+            print(f"  {name:<24} {1000 * stats['median_s']:10.3f} ms")
+        print(f"  {'memory plain / typed':<24} {run['memory']['plain_bytes'] / 1e6:10.1f} MB"
+              f" / {run['memory']['typed_bytes'] / 1e6:.1f} MB")
+        runs.append(run)
+    if args.generate_only:
+        return
+
+    output = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'matplotlib': matplotlib.__version__,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'runs': runs,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\nWrote results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(output, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
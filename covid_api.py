@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import json
+import math
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from covid_cache import LRUCache
+from covid_data import DATA_FILE, SnapshotIndex
+from covid_stats import CountryTimeSeries, DeathRateQuery
+
+# Encoded responses kept for all clients
+RESPONSE_CACHE_SIZE = 1024
+# Seconds between checks for days appended to the CSV
+REFRESH_INTERVAL = 1.0
+# Longest request line or header accepted
+MAX_LINE = 8192
+
+# Filter defaults, as in the dashboard sliders
+DEFAULT_MIN_CASES = 1000
+DEFAULT_TESTING_THRESHOLD = 50.0
+
+# Per-country columns returned for a date
+COUNTRY_COLUMNS = ['Country', 'Population', 'Total Cases', 'Total Deaths', 'Total Tests',
+                   'Death Rate (%)', 'Num Tests per Positive Case']
+
+
+class ApiError(Exception):
+    """Error answered with ``status`` and a JSON ``{"error": message}`` body."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_values(values):
+    # Plain Python values of a Series, with null for NaN and missing counts
+    if not pd.api.types.is_numeric_dtype(values.dtype):
+        return values.astype(str).tolist()
+    integer = pd.api.types.is_integer_dtype(values.dtype)
+    floats = values.to_numpy(dtype=float, na_value=np.nan).tolist()
+    return [None if value != value else int(value) if integer else value for value in floats]
+
+
+def _json_float(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _number(query, name, default, kind):
+    values = query.get(name)
+    if not values:
+        return default
+    # Infinite, NaN and huge values would reach the threshold queries, so
+    # anything outside the 64-bit range is rejected as well
+    try:
+        value = kind(values[-1])
+        valid = math.isfinite(value) and abs(value) < 2 ** 63
+    except (ValueError, OverflowError):
+        valid = False
+    if not valid:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be a finite number below 2**63 in magnitude")
+    return value
+
+
+def _encode(payload):
+    # Strict JSON: a NaN that slipped through raises instead of sending 'NaN'
+    return json.dumps(payload, allow_nan=False).encode()
+
+
+class CovidApi:
+    """JSON endpoints over a snapshot table loaded once.
+
+    Every endpoint is a GET:
+
+    - ``/dates``: the available dates
+    - ``/dates/<date>/countries?min_cases=&testing_threshold=``: per-country
+      metrics for the countries passing both filters (both are optional)
+    - ``/estimate?date=&min_cases=&testing_threshold=``: the good-testing
+      death rate and its bootstrap interval (the date defaults to the last)
+    - ``/countries``: the country names
+    - ``/countries/<country>/series``: a country's daily time series
+    - ``/stats``: response cache counters
+
+    Encoded responses are kept in an LRU cache keyed by the parsed
+    parameters, so repeated polls are answered without touching the data.
+    Misses and the periodic refresh run one at a time on a worker thread,
+    which keeps the event loop free to serve cache hits meanwhile.
+    """
+
+    def __init__(self, snapshots, cache_size=RESPONSE_CACHE_SIZE, refresh_interval=REFRESH_INTERVAL):
+        self.snapshots = snapshots
+        self.death_rate_query = DeathRateQuery(snapshots)
+        self.time_series = CountryTimeSeries.from_snapshots(snapshots)
+        self.cache = LRUCache(maxsize=cache_size)
+        self.refresh_interval = refresh_interval
+        self.requests = 0
+        self._last_refresh = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='covid-api')
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _refresh(self):
+        # A CSV that cannot be read right now leaves the loaded data in use,
+        # so requests are still answered until the next check
+        try:
+            self.snapshots.refresh()
+        except (OSError, ValueError):
+            traceback.print_exc()
+        self.time_series.sync(self.snapshots)
+
+    async def respond(self, method, target):
+        """Return the (status, body bytes) for one request."""
+        self.requests += 1
+        try:
+            if method != 'GET':
+                raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "Only GET is supported")
+            loop = asyncio.get_running_loop()
+            if loop.time() - self._last_refresh >= self.refresh_interval:
+                self._last_refresh = loop.time()
+                await loop.run_in_executor(self._executor, self._refresh)
+
+            url = urlsplit(target)
+            parts = [unquote(part) for part in url.path.split('/') if part]
+            key, compute = self.route(parts, parse_qs(url.query))
+            if key is None:
+                return HTTPStatus.OK, _encode(compute())
+            # Appends add dates and a reload bumps the generation; either
+            # changes the key, so stale responses are never served
+            key = (self.snapshots.generation, len(self.snapshots)) + key
+            body = self.cache.get(key)
+            if body is None:
+                body = await loop.run_in_executor(self._executor, lambda: _encode(compute()))
+                self.cache.put(key, body)
+            return HTTPStatus.OK, body
+        except ApiError as e:
+            return e.status, _encode({'error': str(e)})
+        except Exception:
+            # Answer instead of dropping the connection, and keep the traceback
+            traceback.print_exc()
+            return HTTPStatus.INTERNAL_SERVER_ERROR, _encode({'error': "Internal server error"})
+
+    def route(self, parts, query):
+        """Return the cache key and payload function for a request path.
+
+        A key of None means the response is never cached.
+        """
+        if parts == ['dates']:
+            return ('dates',), lambda: {'dates': list(self.snapshots.dates)}
+        if len(parts) == 3 and parts[0] == 'dates' and parts[2] == 'countries':
+            date = parts[1]
+            min_cases = _number(query, 'min_cases', None, int)
+            testing_threshold = _number(query, 'testing_threshold', None, float)
+            return (('countries', date, min_cases, testing_threshold),
+                    lambda: self.date_countries(date, min_cases, testing_threshold))
+        if parts == ['estimate']:
+            dates = query.get('date')
+            date = dates[-1] if dates else self.snapshots.dates[-1]
+            min_cases = _number(query, 'min_cases', DEFAULT_MIN_CASES, int)
+            testing_threshold = _number(query, 'testing_threshold', DEFAULT_TESTING_THRESHOLD, float)
+            return (('estimate', date, min_cases, testing_threshold),
+                    lambda: self.estimate(date, min_cases, testing_threshold))
+        if parts == ['countries']:
+            return ('country_list',), lambda: {'countries': self.time_series.countries.tolist()}
+        if len(parts) == 3 and parts[0] == 'countries' and parts[2] == 'series':
+            country = parts[1]
+            return ('series', country), lambda: self.country_series(country)
+        if parts == ['stats']:
+            return None, lambda: {'requests': self.requests, 'cache': self.cache.stats()}
+        raise ApiError(HTTPStatus.NOT_FOUND, f"No endpoint at /{'/'.join(parts)}")
+
+    def _check_date(self, date):
+        if date not in self.snapshots:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"No data for {date}")
+
+    def date_countries(self, date, min_cases=None, testing_threshold=None):
+        self._check_date(date)
+        date_df = self.snapshots.get_date(date)
+        keep = np.ones(len(date_df), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            if min_cases is not None:
+                keep &= self.snapshots.column(date, 'Total Cases') > min_cases
+            if testing_threshold is not None:
+                keep &= self.snapshots.column(date, 'Num Tests per Positive Case') > testing_threshold
+        rows = date_df.loc[keep, COUNTRY_COLUMNS]
+        return {
+            'date': date,
+            'min_cases': min_cases,
+            'testing_threshold': testing_threshold,
+            'countries': [dict(zip(COUNTRY_COLUMNS, values))
+                          for values in zip(*(_json_values(rows[col]) for col in COUNTRY_COLUMNS))],
+        }
+
+    def estimate(self, date, min_cases, testing_threshold):
+        self._check_date(date)
+        estimate = self.death_rate_query.estimate(date, min_cases, testing_threshold)
+        interval = self.death_rate_query.confidence_interval(date, min_cases, testing_threshold)
+        return {
+            'date': date,
+            'min_cases': min_cases,
+            'testing_threshold': testing_threshold,
+            'death_rate': _json_float(estimate.death_rate),
+            'countries': int(estimate.countries),
+            'deaths': float(estimate.deaths),
+            'cases': float(estimate.cases),
+            'interval': {
+                'low': _json_float(interval.low),
+                'high': _json_float(interval.high),
+                'confidence': interval.confidence,
+                'resamples': interval.resamples,
+            },
+        }
+
+    def country_series(self, country):
+        try:
+            country_df = self.time_series.country_frame(country)
+        except KeyError:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"Unknown country {country}") from None
+        return {
+            'country': country,
+            'dates': list(country_df.index),
+            'series': {name: _json_values(country_df[name]) for name in country_df.columns},
+        }
+
+
+async def _read_request(reader):
+    # Request line and headers of the next request, or None at end of stream
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    # GET requests have no body, but skip one if a client sends it
+    length = int(headers.get('content-length') or 0)
+    if length:
+        await reader.readexactly(length)
+    method, target, version = request_line.decode('latin-1').split()
+    return method, target, version, headers
+
+
+def _keep_alive(version, headers):
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        return connection == 'keep-alive'
+    return connection != 'close'
+
+
+async def serve(api, host='127.0.0.1', port=8000):
+    """Serve ``api`` over HTTP/1.1 with keep-alive until cancelled."""
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers = request
+                status, body = await api.respond(method, target)
+                keep_alive = _keep_alive(version, headers)
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass  # Malformed request or client gone; drop the connection
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port, limit=MAX_LINE)
+    addresses = ', '.join(f"http://{sock.getsockname()[0]}:{sock.getsockname()[1]}" for sock in server.sockets)
+    print(f"Serving {len(api.snapshots)} dates on {addresses}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the COVID-19 snapshot metrics as a local JSON API")
+    parser.add_argument('--csv', default=DATA_FILE,
+                        help="Path to the snapshot CSV (default: %(default)s)")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="Address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=8000,
+                        help="Port to listen on (default: %(default)s)")
+    parser.add_argument('--cache-size', type=int, default=RESPONSE_CACHE_SIZE,
+                        help="Encoded responses kept in the LRU cache (default: %(default)s)")
+    args = parser.parse_args()
+
+    api = CovidApi(SnapshotIndex.from_csv(args.csv), cache_size=args.cache_size)
+    try:
+        asyncio.run(serve(api, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Default size limit of an on-disk plot cache directory
+PLOT_CACHE_DISK_BYTES = 64 * 1024 * 1024
+
+
+class LRUCache:
+    """Thread-safe, size-bounded cache with least-recently-used eviction.
+
+    Keeps hit, miss and eviction counters so front ends can show how well
+    the cache is working.
+    """
+
+    def __init__(self, maxsize=128):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, calling ``compute()`` on a miss.
+
+        ``compute`` runs outside the lock, so two callers missing the same
+        key at once may both compute it; the last result is kept.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def content_key(*parts):
+    """Return a hex digest identifying ``parts``.
+
+    Arrays are hashed by dtype, shape and contents (text arrays by their
+    values), anything else by its repr, so equal data and parameters give
+    the same key in every process.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            if part.dtype == object:
+                digest.update(b'text')
+                digest.update('\0'.join(map(str, part.tolist())).encode())
+            else:
+                digest.update(f"{part.dtype.str}{part.shape}".encode())
+                digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+class PlotCache:
+    """Rendered images keyed by content_key(), in memory and on disk.
+
+    The memory tier is an LRUCache. The optional disk tier keeps one file
+    per key in ``directory`` and, when a write takes it past
+    ``max_disk_bytes``, removes the least recently read or written files.
+    Files are written atomically, so several processes can share one
+    directory.
+    """
+
+    def __init__(self, directory=None, max_memory_items=64, max_disk_bytes=PLOT_CACHE_DISK_BYTES,
+                 suffix='.png'):
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.suffix = suffix
+        self.memory = LRUCache(maxsize=max_memory_items)
+        self.disk_hits = 0
+        self.disk_evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        data = self.memory.get(key)
+        if data is not None or self.directory is None:
+            return data
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # Recently used files are evicted last
+        except OSError:
+            pass  # Read-only or shared directory: the image is still good
+        self.disk_hits += 1
+        self.memory.put(key, data)
+        return data
+
+    def put(self, key, data):
+        self.memory.put(key, data)
+        if self.directory is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            return  # A read-only or full disk only costs the disk tier
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # Removed by another process
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                self.disk_evictions += 1
+            except OSError:
+                pass
+            total -= size
+
+    def get_or_render(self, key, render):
+        """Return the cached image for ``key``, calling ``render()`` on a miss."""
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats.update(disk_hits=self.disk_hits, disk_evictions=self.disk_evictions)
+        return stats
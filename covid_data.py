@@ -0,0 +1,630 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+DATA_FILE = 'worldometer_snapshots_April18_to_May18.csv'
+
+# Bump when the on-disk cache layout changes so old caches are rebuilt
+CACHE_VERSION = 2
+CACHE_SUFFIX = '.npcache'
+
+# Bytes before the loaded end of the CSV that refresh() compares to tell an
+# append from a rewrite
+SOURCE_MARKER_BYTES = 4096
+
+# Tests per positive case are clipped to this value on the scatter plots
+X_AXIS_LIMIT = 80
+
+# Columns added by add_derived_metrics()
+DERIVED_COLUMNS = ['Case Fatality Ratio', 'Num Tests per Positive Case', 'Death Rate (%)',
+                   'Tests Per Case', 'Log Population', 'Log Deaths']
+
+# Count columns, stored as the narrowest nullable integer type that fits
+COUNT_COLUMNS = ['Population', 'Total Tests', 'Total Cases', 'Total Deaths',
+                 'Total Recovered', 'Serious or Critical', 'Active Cases']
+
+# Nullable integer types from narrowest to widest
+_INTEGER_TYPES = ['Int8', 'Int16', 'Int32', 'Int64']
+
+
+def apply_schema(df):
+    """Convert a snapshot table read from CSV to compact column types in place.
+
+    ``Date`` becomes datetime64, ``Country`` and any other text column become
+    categoricals, and count columns become nullable integers, so missing
+    values such as an absent ``Total Tests`` stay missing. Count columns
+    with fractional values are left as floats. Converting an already
+    converted table is a no-op.
+    """
+    if 'Date' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        df['Date'] = pd.to_datetime(df['Date'])
+    for name in df.columns:
+        values = df[name]
+        if name in COUNT_COLUMNS:
+            df[name] = _narrow_integers(values)
+        elif name != 'Date' and not (pd.api.types.is_numeric_dtype(values)
+                                     or isinstance(values.dtype, pd.CategoricalDtype)):
+            df[name] = values.astype('category')
+    return df
+
+
+def _narrow_integers(values):
+    if pd.api.types.is_extension_array_dtype(values.dtype) and pd.api.types.is_integer_dtype(values.dtype):
+        return values
+    floats = values.to_numpy(dtype=float, na_value=np.nan)
+    missing = np.isnan(floats)
+    present = floats[~missing]
+    if not np.array_equal(present, np.round(present)):
+        return values
+    low, high = (present.min(), present.max()) if len(present) else (0, 0)
+    for dtype in _INTEGER_TYPES:
+        info = np.iinfo(dtype.lower())
+        if info.min <= low and high <= info.max:
+            break
+    data = np.where(missing, 0, floats).astype(dtype.lower())
+    return pd.arrays.IntegerArray(data, missing)
+
+
+def format_dates(values):
+    """Return dates (datetime64 or ISO strings) as 'YYYY-MM-DD' strings."""
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return np.datetime_as_string(values, unit='D').tolist()
+    return [str(value) for value in values]
+
+
+def concat_snapshots(first, second):
+    """Concatenate two snapshot tables, keeping categorical columns categorical."""
+    for name in first.columns:
+        if (isinstance(first[name].dtype, pd.CategoricalDtype)
+                and isinstance(second[name].dtype, pd.CategoricalDtype)):
+            # New categories go after the existing ones, so old codes are kept
+            categories = first[name].cat.categories.append(
+                second[name].cat.categories.difference(first[name].cat.categories, sort=False))
+            first = first.assign(**{name: first[name].cat.set_categories(categories)})
+            second = second.assign(**{name: second[name].cat.set_categories(categories)})
+    return pd.concat([first, second], ignore_index=True)
+
+
+def memory_report(path=DATA_FILE):
+    """Return per-column memory use in bytes of the plain and typed tables.
+
+    ``plain`` is what ``pd.read_csv`` produces, with the derived metrics as
+    float64; ``typed`` is the table SnapshotIndex holds.
+    """
+    plain = pd.read_csv(path)
+    typed = add_derived_metrics(apply_schema(plain.copy()))
+    for name in DERIVED_COLUMNS:
+        plain[name] = typed[name].astype(np.float64)
+    return pd.DataFrame({
+        'plain': plain.memory_usage(deep=True, index=False),
+        'typed': typed.memory_usage(deep=True, index=False),
+        'plain dtype': plain.dtypes.astype(str),
+        'typed dtype': typed.dtypes.astype(str),
+    })
+
+
+def load_snapshots(path=DATA_FILE, use_cache=True):
+    """Load the snapshot table with rows grouped contiguously by date.
+
+    Columns have the compact types of apply_schema(). When ``use_cache`` is
+    set, the binary column cache next to the CSV is reused if it is still
+    valid and rebuilt otherwise.
+    """
+    return _load_snapshots(path, use_cache)[0]
+
+
+def _load_snapshots(path, use_cache=True):
+    # load_snapshots() plus the stat of the CSV contents the table holds
+    if use_cache:
+        df, meta = _read_snapshot_cache(path)
+        if df is not None:
+            return df, meta['source']
+    df, source, digest = _parse_snapshots(path)
+    if use_cache:
+        try:
+            write_snapshot_cache(df, path, source, digest)
+        except OSError as e:
+            warnings.warn(f"Could not write snapshot cache for {path}: {e}")
+    return df, source
+
+
+def _parse_snapshots(path):
+    # Parse the CSV from a single read, so the stat and digest recorded for
+    # the cache describe exactly the rows parsed even if a day is appended
+    # meanwhile
+    stat = _source_stat(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    # A file that grew after the stat gets the stat's mtime with the size
+    # read: the content hash then decides whether the cache is still valid
+    source = {'size': len(data), 'mtime_ns': stat['mtime_ns']}
+    df = apply_schema(pd.read_csv(io.BytesIO(data)))
+    if not df['Date'].is_monotonic_increasing:
+        # A stable sort keeps the original country order within each date
+        df = df.sort_values('Date', kind='stable').reset_index(drop=True)
+    return df, source, hashlib.sha256(data).hexdigest()
+
+
+def add_derived_metrics(df):
+    """Add the per-row metrics used by the plots and estimates to ``df``.
+
+    Ratios are NaN where ``Total Cases`` is zero or missing, and tests per
+    positive case is NaN where ``Total Tests`` is missing, so such rows drop
+    out of the threshold filters instead of producing inf. The metrics are
+    stored as float32.
+    """
+    cases = df['Total Cases'].to_numpy(dtype=float, na_value=np.nan)
+    deaths = df['Total Deaths'].to_numpy(dtype=float, na_value=np.nan)
+    tests = df['Total Tests'].to_numpy(dtype=float, na_value=np.nan)
+    population = df['Population'].to_numpy(dtype=float, na_value=np.nan)
+
+    has_cases = cases > 0
+    safe_cases = np.where(has_cases, cases, 1.0)
+    case_fatality = np.where(has_cases, deaths / safe_cases, np.nan)
+    tests_per_case = np.where(has_cases, tests / safe_cases, np.nan)
+
+    df['Case Fatality Ratio'] = case_fatality.astype(np.float32)
+    df['Num Tests per Positive Case'] = tests_per_case.astype(np.float32)
+    df['Death Rate (%)'] = (100 * case_fatality).astype(np.float32)
+    df['Tests Per Case'] = np.minimum(tests_per_case, X_AXIS_LIMIT).astype(np.float32)
+    df['Log Population'] = np.log1p(population).astype(np.float32)
+    df['Log Deaths'] = np.log10(1 + deaths).astype(np.float32)
+    return df
+
+
+def stream_snapshots(path=DATA_FILE, dates=None, countries=None, chunksize=100_000):
+    """Read the CSV in chunks, keeping only rows for ``dates`` or ``countries``.
+
+    Memory use is bounded by ``chunksize`` plus the rows that are kept,
+    so files larger than RAM can be analyzed for a handful of dates or
+    countries. Rows are returned in file order with the apply_schema() types.
+    """
+    dates = set(dates or ())
+    countries = set(countries or ())
+    kept = []
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        # Filter on the raw text, then convert only the rows that are kept
+        mask = chunk['Date'].isin(dates) | chunk['Country'].isin(countries)
+        if mask.any():
+            kept.append(chunk.loc[mask])
+    if not kept:
+        return apply_schema(pd.read_csv(path, nrows=0))
+    return apply_schema(pd.concat(kept, ignore_index=True))
+
+
+def snapshot_cache_dir(path):
+    """Return the cache directory used for a snapshot CSV."""
+    return os.fspath(path) + CACHE_SUFFIX
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _column_files(values):
+    # The cache kind of a typed column and the arrays stored for it
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return 'category', {'': values.cat.codes.to_numpy().astype(np.int32),
+                            '_values': np.asarray(values.cat.categories, dtype=str)}
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return 'datetime', {'': values.to_numpy()}
+    if pd.api.types.is_extension_array_dtype(values.dtype):
+        dtype = values.dtype.numpy_dtype
+        return 'nullable', {'': values.to_numpy(dtype=dtype, na_value=0),
+                            '_mask': values.isna().to_numpy()}
+    return 'numeric', {'': values.to_numpy()}
+
+
+def write_snapshot_cache(df, path, source=None, sha256=None):
+    """Write ``df`` as one ``.npy`` file per column next to the CSV.
+
+    Categorical columns are stored as integer codes plus a table of
+    categories, and nullable integers as values plus a missing-value mask,
+    so every file can be memory-mapped without pickling. ``source`` and
+    ``sha256`` describe the CSV contents ``df`` was parsed from and default
+    to the file as it is now.
+    """
+    cache_dir = snapshot_cache_dir(path)
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    tmp_dir = tempfile.mkdtemp(prefix='.snapshot-cache-', dir=parent)
+    try:
+        columns = []
+        for i, name in enumerate(df.columns):
+            kind, arrays = _column_files(df[name])
+            for suffix, array in arrays.items():
+                np.save(os.path.join(tmp_dir, f'col_{i}{suffix}.npy'), array)
+            columns.append({'name': name, 'kind': kind})
+        meta = {
+            'version': CACHE_VERSION,
+            'source': source or _source_stat(path),
+            'sha256': sha256 or _file_digest(path),
+            'rows': len(df),
+            'columns': columns,
+        }
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.replace(tmp_dir, cache_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return cache_dir
+
+
+def _valid_cache_meta(path, cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    source = _source_stat(path)
+    if meta['source'] == source:
+        return meta
+    if meta['source']['size'] != source['size']:
+        return None
+    # Same size but a new mtime (e.g. after a checkout): trust the content hash
+    if _file_digest(path) != meta['sha256']:
+        return None
+    meta['source'] = source
+    try:
+        with open(os.path.join(cache_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+    except OSError:
+        pass
+    return meta
+
+
+def read_snapshot_cache(path, mmap_mode='r'):
+    """Load the cached columns for ``path``, or None if the cache is stale."""
+    return _read_snapshot_cache(path, mmap_mode)[0]
+
+
+def _read_snapshot_cache(path, mmap_mode='r'):
+    # The cached table and the metadata it was validated with
+    cache_dir = snapshot_cache_dir(path)
+    meta = _valid_cache_meta(path, cache_dir)
+    if meta is None:
+        return None, None
+    data = {}
+    try:
+        for i, column in enumerate(meta['columns']):
+            values = np.load(os.path.join(cache_dir, f'col_{i}.npy'), mmap_mode=mmap_mode)
+            if column['kind'] == 'category':
+                categories = np.load(os.path.join(cache_dir, f'col_{i}_values.npy'))
+                # Code -1 marks a missing value
+                values = pd.Categorical.from_codes(np.asarray(values), categories)
+            elif column['kind'] == 'nullable':
+                mask = np.load(os.path.join(cache_dir, f'col_{i}_mask.npy'))
+                values = pd.arrays.IntegerArray(np.asarray(values), np.asarray(mask))
+            data[column['name']] = values
+    except (OSError, ValueError):
+        return None, None
+    return pd.DataFrame(data), meta
+
+
+def _encode_text(values, uniques):
+    # Codes for ``values`` against an existing value table, extending it
+    # with any values not seen before; missing values get code -1
+    values = pd.Series(values, dtype=object).to_numpy()
+    missing = pd.isna(values)
+    codes = pd.Index(uniques).get_indexer(values)
+    unseen = (codes == -1) & ~missing
+    if unseen.any():
+        new_uniques = pd.unique(values[unseen])
+        codes[unseen] = len(uniques) + pd.Index(new_uniques).get_indexer(values[unseen])
+        uniques = np.concatenate([np.asarray(uniques, dtype=object), new_uniques])
+    return codes.astype(np.int32), uniques
+
+
+def _append_snapshot_cache(path, cache_dir, meta, new_df):
+    # Extend each cached column with the new (typed) rows, then record the
+    # new CSV stat last so an interrupted append leaves the cache invalid,
+    # not wrong
+    for i, column in enumerate(meta['columns']):
+        values = new_df[column['name']]
+        if column['kind'] == 'category':
+            values_path = os.path.join(cache_dir, f'col_{i}_values.npy')
+            codes, uniques = _encode_text(values, np.load(values_path))
+            new_arrays = {'': codes, '_values': np.asarray(uniques, dtype=str)}
+        else:
+            _, new_arrays = _column_files(values)
+        for suffix, array in new_arrays.items():
+            array_path = os.path.join(cache_dir, f'col_{i}{suffix}.npy')
+            if suffix != '_values':
+                # Arrays are concatenated, upcasting if a count needs a wider type
+                array = np.concatenate([np.load(array_path), array])
+            np.save(array_path + '.tmp.npy', array)
+            os.replace(array_path + '.tmp.npy', array_path)
+    meta['rows'] += len(new_df)
+    meta['source'] = _source_stat(path)
+    meta['sha256'] = _file_digest(path)
+    with open(os.path.join(cache_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def _last_date(path, cache_dir, meta):
+    if meta is not None:
+        # Cached rows are sorted by date, so the last one has the latest date
+        names = [column['name'] for column in meta['columns']]
+        dates = np.load(os.path.join(cache_dir, f"col_{names.index('Date')}.npy"), mmap_mode='r')
+        return format_dates(dates[-1:])[0] if len(dates) else None
+    dates = pd.read_csv(path, usecols=['Date'])['Date'].dropna().tolist()
+    return max(dates) if dates else None
+
+
+def append_snapshot(path, new_path):
+    """Append the rows of the snapshot file ``new_path`` to the CSV at ``path``.
+
+    The new file must have the same header and only contain dates after the
+    last date already in ``path``. Its lines are appended to the CSV as-is,
+    and a valid binary cache is extended in place instead of being rebuilt.
+    Running apps pick the rows up through SnapshotIndex.refresh().
+    Returns the rows that were appended.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(0, os.SEEK_END)
+        ends_with_newline = True
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            ends_with_newline = f.read(1) == b'\n'
+    with open(new_path, 'rb') as f:
+        new_header = f.readline()
+        new_body = f.read()
+    if new_header.strip() != header.strip():
+        raise ValueError(f"{new_path} does not have the same columns as {path}")
+
+    new_df = pd.read_csv(io.BytesIO(new_header + new_body))
+    if new_df.empty:
+        return new_df
+    if not new_df['Date'].is_monotonic_increasing:
+        raise ValueError(f"Rows in {new_path} must be sorted by date")
+
+    cache_dir = snapshot_cache_dir(path)
+    meta = _valid_cache_meta(path, cache_dir)
+    last_date = _last_date(path, cache_dir, meta)
+    if last_date is not None and new_df['Date'].iloc[0] <= last_date:
+        raise ValueError(f"{new_path} contains dates up to {last_date} that are already loaded")
+
+    with open(path, 'ab') as f:
+        if not ends_with_newline:
+            f.write(b'\n')
+        f.write(new_body if new_body.endswith(b'\n') else new_body + b'\n')
+    if meta is not None:
+        _append_snapshot_cache(path, cache_dir, meta, apply_schema(new_df.copy()))
+    return new_df
+
+
+class SnapshotIndex:
+    """Date index over a snapshot table.
+
+    Rows for each date are stored contiguously, so fetching a date is a
+    positional slice of the loaded table instead of a boolean scan. The
+    derived metrics are computed once for all dates when the index is built.
+
+    New dates can be added without a reload, either directly with append()
+    or with refresh(), which reads only the rows appended to the source CSV
+    since it was loaded.
+    """
+
+    def __init__(self, df, source=None, source_size=None):
+        self.source = source
+        self._source_size = self._source_mtime_ns = self._source_marker = None
+        if source is not None and source_size is not None:
+            self._track_source(source_size)
+        # Bumped on a full reload, so per-date structures know to start over
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._set_table(add_derived_metrics(df))
+
+    def _track_source(self, size, mtime_ns=None, marker=None):
+        # Remember where the loaded bytes end, with the bytes just before that
+        # offset, so refresh() can check they are still there
+        if mtime_ns is None:
+            mtime_ns = os.stat(self.source).st_mtime_ns
+        if marker is None:
+            with open(self.source, 'rb') as f:
+                f.seek(max(0, size - SOURCE_MARKER_BYTES))
+                marker = f.read(min(size, SOURCE_MARKER_BYTES))
+        self._source_size = size
+        self._source_mtime_ns = mtime_ns
+        self._source_marker = marker
+
+    @staticmethod
+    def _index_dates(df):
+        # The dates of ``df`` and the (start, stop) rows of each
+        dates = df['Date'].to_numpy()
+        # Start of every run of equal dates, plus the end of the table
+        if len(dates):
+            starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])
+        else:
+            starts = np.array([], dtype=np.intp)
+        bounds = np.r_[starts, len(dates)]
+        labels = format_dates(dates[starts])
+        if len(set(labels)) != len(labels):
+            raise ValueError("Snapshot rows must be grouped by date")
+        return labels, {date: (int(bounds[i]), int(bounds[i + 1])) for i, date in enumerate(labels)}
+
+    def _set_table(self, df, dates=None, ranges=None):
+        # The table and its ranges are swapped in as one tuple, so readers on
+        # other threads never slice one table with the ranges of another.
+        # The date list follows, so every listed date is already indexed.
+        if ranges is None:
+            dates, ranges = self._index_dates(df)
+        self._view = (df, ranges)
+        self.dates = dates
+
+    @property
+    def df(self):
+        return self._view[0]
+
+    @classmethod
+    def from_csv(cls, path=DATA_FILE):
+        # The size comes with the table, so refresh() starts from the bytes loaded
+        df, source = _load_snapshots(path)
+        return cls(df, source=path, source_size=source['size'])
+
+    def append(self, new_df):
+        """Add rows for dates after the last loaded date; return the new dates."""
+        if new_df.empty:
+            return []
+        new_df = apply_schema(new_df.copy())
+        if not new_df['Date'].is_monotonic_increasing:
+            new_df = new_df.sort_values('Date', kind='stable')
+        new_df = add_derived_metrics(new_df.reset_index(drop=True))
+        new_dates = new_df['Date'].to_numpy()
+        if self.dates and format_dates(new_dates[:1])[0] <= self.dates[-1]:
+            raise ValueError(f"Appended rows must be dated after {self.dates[-1]}")
+
+        # Index only the new rows, offset by the current table length
+        df, ranges = self._view
+        offset = len(df)
+        starts = np.flatnonzero(np.r_[True, new_dates[1:] != new_dates[:-1]])
+        bounds = np.r_[starts, len(new_dates)] + offset
+        added = format_dates(new_dates[starts])
+        ranges = dict(ranges)
+        ranges.update((date, (int(bounds[i]), int(bounds[i + 1]))) for i, date in enumerate(added))
+        self._set_table(concat_snapshots(df, new_df), self.dates + added, ranges)
+        return added
+
+    def refresh(self):
+        """Load rows appended to the source CSV since the last load or refresh.
+
+        Returns the newly available dates. The file counts as appended to
+        only if it grew and the bytes before the previous end are unchanged.
+        Otherwise it was rewritten, so everything is reloaded, the generation
+        counter is bumped, and all dates are returned.
+        """
+        if self.source is None:
+            return []
+        with self._lock:
+            stat = os.stat(self.source)
+            size = stat.st_size
+            if size == self._source_size and stat.st_mtime_ns == self._source_mtime_ns:
+                return []
+            if self._source_size is None or size <= self._source_size:
+                return self._reload()
+
+            with open(self.source, 'rb') as f:
+                f.seek(max(0, self._source_size - SOURCE_MARKER_BYTES))
+                marker = f.read(len(self._source_marker))
+                if marker != self._source_marker:
+                    return self._reload()
+                tail = f.read(size - self._source_size)
+            # Leave a partly written last line for the next refresh
+            complete = tail.rfind(b'\n') + 1
+            marker = (marker + tail[:complete])[-SOURCE_MARKER_BYTES:]
+            if not tail[:complete].strip():
+                self._track_source(self._source_size + complete, stat.st_mtime_ns, marker)
+                return []
+            raw_columns = [col for col in self.df.columns if col not in DERIVED_COLUMNS]
+            try:
+                new_df = pd.read_csv(io.BytesIO(tail[:complete]), header=None, names=raw_columns)
+                added = self.append(new_df)
+            except ValueError:
+                # Rows that do not parse or do not follow the loaded dates
+                # mean the file was not simply appended to
+                return self._reload()
+            self._track_source(self._source_size + complete, stat.st_mtime_ns, marker)
+            return added
+
+    def _reload(self):
+        # Called with the lock held; the new table is swapped in before the
+        # generation is bumped, so a reader that sees the new generation
+        # also sees the new table
+        df, source = _load_snapshots(self.source)
+        self._set_table(add_derived_metrics(df))
+        self._track_source(source['size'], source['mtime_ns'])
+        self.generation += 1
+        return list(self.dates)
+
+    def __contains__(self, date):
+        return date in self._view[1]
+
+    def __len__(self):
+        return len(self.dates)
+
+    def date_range(self, date):
+        """Return the (start, stop) row positions for a date."""
+        return self._view[1][date]
+
+    def get_date(self, date):
+        """Return the rows for a date as a slice of the loaded table."""
+        df, ranges = self._view
+        start, stop = ranges[date]
+        return df.iloc[start:stop]
+
+    def column(self, date, name):
+        """Return one column of a date as a NumPy array.
+
+        Plain columns are returned as a view; nullable integer columns are
+        converted to floats with NaN for missing values.
+        """
+        df, ranges = self._view
+        start, stop = ranges[date]
+        values = df[name]
+        if pd.api.types.is_extension_array_dtype(values.dtype) and pd.api.types.is_numeric_dtype(values):
+            return values.iloc[start:stop].to_numpy(dtype=float, na_value=np.nan)
+        return values.to_numpy()[start:stop]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the binary column cache for a snapshot CSV, "
+                    "or append a new day's snapshot to it")
+    parser.add_argument('csv', nargs='?', default=DATA_FILE,
+                        help="Snapshot CSV to convert (default: %(default)s)")
+    parser.add_argument('--force', action='store_true',
+                        help="Rebuild the cache even if it is up to date")
+    parser.add_argument('--append', metavar='SNAPSHOT_CSV',
+                        help="Append a new day's snapshot file to the CSV and its cache")
+    parser.add_argument('--memory', action='store_true',
+                        help="Report memory use per column before and after typed loading")
+    args = parser.parse_args()
+
+    if args.memory:
+        report = memory_report(args.csv)
+        print(report.to_string(formatters={'plain': '{:,}'.format, 'typed': '{:,}'.format}))
+        plain, typed = report['plain'].sum(), report['typed'].sum()
+        print(f"\nTotal: {plain / 1e6:.2f} MB plain, {typed / 1e6:.2f} MB typed "
+              f"({100 * (1 - typed / plain):.0f}% less)")
+        return
+
+    if args.append:
+        new_df = append_snapshot(args.csv, args.append)
+        dates = ', '.join(sorted(new_df['Date'].unique())) if len(new_df) else 'nothing'
+        print(f"Appended {len(new_df)} rows ({dates}) to {args.csv}")
+        return
+
+    if not args.force and read_snapshot_cache(args.csv) is not None:
+        print(f"Cache is up to date: {snapshot_cache_dir(args.csv)}")
+        return
+    df, source, digest = _parse_snapshots(args.csv)
+    cache_dir = write_snapshot_cache(df, args.csv, source, digest)
+    print(f"Wrote {len(df)} rows to {cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
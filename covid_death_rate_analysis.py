@@ -1,110 +1,306 @@
+import argparse
+import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-# Load the main data table
-print("Loading data...")
-worldometer_df = pd.read_csv('worldometer_snapshots_April18_to_May18.csv')
-print("Data shape:", worldometer_df.shape)
-print("\nFirst few rows of the dataset:")
-print(worldometer_df.head())
-
-# Example of filtering by country
-country_name = 'USA'
-country_df = worldometer_df.loc[worldometer_df['Country'] == country_name, :].reset_index(drop=True)
-print(f"\nData for {country_name}:")
-print(country_df.head())
-
-# Example of filtering by date
-selected_date = datetime.strptime('18/05/2020', '%d/%m/%Y')
-selected_date_df = worldometer_df.loc[worldometer_df['Date'] == selected_date.strftime('%Y-%m-%d'), :].reset_index(drop=True)
-print(f"\nData for {selected_date.strftime('%Y-%m-%d')}:")
-print(selected_date_df.head())
-
-# Analysis using the last date
-last_date = datetime.strptime('18/05/2020', '%d/%m/%Y')
-last_date_df = worldometer_df.loc[worldometer_df['Date'] == last_date.strftime('%Y-%m-%d'), :].reset_index(drop=True)
-print(f"\nData for the last date {last_date.strftime('%Y-%m-%d')}:")
-print(last_date_df.head())
-
-# Calculate naive death rate for each country
-last_date_df['Case Fatality Ratio'] = last_date_df['Total Deaths'] / last_date_df['Total Cases']
-
-# Plot histogram of death rates
-plt.figure(figsize=(12,8))
-plt.hist(100 * np.array(last_date_df['Case Fatality Ratio']), bins=np.arange(35))
-plt.xlabel('Death Rate (%)', fontsize=16)
-plt.ylabel('Number of Countries', fontsize=16)
-plt.title('Histogram of Death Rates for various Countries', fontsize=18)
-plt.savefig('death_rate_histogram.png')
-print("\nCreated death rate histogram")
-
-# Filter out countries with small number of cases
-min_number_of_cases = 1000
-greatly_affected_df = last_date_df.loc[last_date_df['Total Cases'] > min_number_of_cases,:]
-
-# Plot histogram for countries with significant cases
-plt.figure(figsize=(12,8))
-plt.hist(100 * np.array(greatly_affected_df['Case Fatality Ratio']), bins=np.arange(35))
-plt.xlabel('Death Rate (%)', fontsize=16)
-plt.ylabel('Number of Countries', fontsize=16)
-plt.title('Histogram of Death Rates for Countries with >1000 Cases', fontsize=18)
-plt.savefig('death_rate_histogram_filtered.png')
-print("\nCreated filtered death rate histogram")
-
-# Plot scatter of death rate as function of testing quality
-last_date_df['Num Tests per Positive Case'] = last_date_df['Total Tests'] / last_date_df['Total Cases']
-
-# Use the filtered dataframe for greatly affected countries
-min_number_of_cases = 1000
-greatly_affected_df = last_date_df.loc[last_date_df['Total Cases'] > min_number_of_cases,:]
-
-x_axis_limit = 80
-
-death_rate_percent = 100 * np.array(greatly_affected_df['Case Fatality Ratio'])
-num_test_per_positive = np.array(greatly_affected_df['Num Tests per Positive Case'])
-num_test_per_positive[num_test_per_positive > x_axis_limit] = x_axis_limit
-total_num_deaths = np.array(greatly_affected_df['Total Deaths'])
-population = np.array(greatly_affected_df['Population'])
-
-plt.figure(figsize=(16,12))
-plt.scatter(x=num_test_per_positive, y=death_rate_percent, 
-            s=0.5*np.power(np.log(1+population),2), 
-            c=np.log10(1+total_num_deaths))
-plt.colorbar()
-plt.ylabel('Death Rate (%)', fontsize=16)
-plt.xlabel('Number of Tests per Positive Case', fontsize=16)
-plt.title('Death Rate as function of Testing Quality', fontsize=18)
-plt.xlim(-1, x_axis_limit + 12)
-plt.ylim(-0.2,17)
-
-# Plot country names on the scatter plot
-countries_to_display = ['USA', 'Russia', 'Spain', 'Brazil', 'UK', 'Italy', 'France', 
-                        'Germany', 'India', 'Canada', 'Belgium', 'Mexico', 'Netherlands', 
-                        'Sweden', 'Portugal', 'UAE', 'Poland', 'Indonesia', 'Romania', 
-                        'Israel','Thailand','Kyrgyzstan','El Salvador', 'S. Korea', 
+from covid_data import DATA_FILE, SnapshotIndex, add_derived_metrics, stream_snapshots
+from covid_cache import PlotCache
+from covid_plots import histogram_png, plot_cache_dir, scatter_png
+from covid_stats import (BOOTSTRAP_RESAMPLES, BOOTSTRAP_SEED, DeathRateQuery, bootstrap_death_rate,
+                         threshold_sweep)
+from covid_timing import ProfileDump, StageTimer
+
+# Countries labelled on the scatter plot
+countries_to_display = ['USA', 'Russia', 'Spain', 'Brazil', 'UK', 'Italy', 'France',
+                        'Germany', 'India', 'Canada', 'Belgium', 'Mexico', 'Netherlands',
+                        'Sweden', 'Portugal', 'UAE', 'Poland', 'Indonesia', 'Romania',
+                        'Israel','Thailand','Kyrgyzstan','El Salvador', 'S. Korea',
                         'Denmark', 'Serbia', 'Norway', 'Algeria', 'Bahrain','Slovenia',
-                        'Greece','Cuba','Hong Kong','Lithuania', 'Australia', 'Morocco', 
-                        'Malaysia', 'Nigeria', 'Moldova', 'Ghana', 'Armenia', 'Bolivia', 
+                        'Greece','Cuba','Hong Kong','Lithuania', 'Australia', 'Morocco',
+                        'Malaysia', 'Nigeria', 'Moldova', 'Ghana', 'Armenia', 'Bolivia',
                         'Iraq', 'Hungary', 'Cameroon', 'Azerbaijan']
 
-for country_name in countries_to_display:
-    country_indices = greatly_affected_df.index[greatly_affected_df['Country'] == country_name].tolist()
-    if country_indices:  # Check if the country exists in the dataframe
-        country_index = country_indices[0]
-        plt.text(x=num_test_per_positive[country_index] + 0.5,
-                y=death_rate_percent[country_index] + 0.2,
-                s=country_name, fontsize=10)
-plt.savefig('death_rate_vs_testing.png')
-print("\nCreated scatter plot of death rate vs testing quality")
-
-# Look at data from best testing countries
-good_testing_threshold = 50
-good_testing_df = greatly_affected_df.loc[greatly_affected_df['Num Tests per Positive Case'] > good_testing_threshold,:]
-print("\nCountries with good testing (>50 tests per positive case):")
-print(good_testing_df[['Country', 'Total Cases', 'Total Deaths', 'Total Tests', 'Num Tests per Positive Case', 'Case Fatality Ratio']].head())
-
-# Calculate the death rate for these countries
-estimated_death_rate_percent = 100 * good_testing_df['Total Deaths'].sum() / good_testing_df['Total Cases'].sum()
-print(f'\nDeath Rate only for "good testing countries" is {estimated_death_rate_percent:.2f}%') 
\ No newline at end of file
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="COVID-19 death rate analysis")
+    parser.add_argument('--csv', default=DATA_FILE,
+                        help="Snapshot CSV to analyze (default: %(default)s)")
+    parser.add_argument('--date', default='18/05/2020',
+                        help="Date to analyze as DD/MM/YYYY (default: %(default)s)")
+    parser.add_argument('--country', default='USA',
+                        help="Country to show as an example (default: %(default)s)")
+    parser.add_argument('--min-cases', type=int, default=1000,
+                        help="Minimum number of cases per country (default: %(default)s)")
+    parser.add_argument('--testing-threshold', type=float, default=50,
+                        help="Tests per positive case for good testing (default: %(default)s)")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Read the CSV in chunks and keep only the rows needed, "
+                             "for files that do not fit in memory")
+    parser.add_argument('--chunksize', type=int, default=100_000,
+                        help="Rows per chunk in streaming mode (default: %(default)s)")
+    parser.add_argument('--no-plot-cache', action='store_true',
+                        help="Render every plot instead of reusing images from the plot cache")
+    parser.add_argument('--resamples', type=int, default=BOOTSTRAP_RESAMPLES,
+                        help="Bootstrap resamples for the confidence interval (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=BOOTSTRAP_SEED,
+                        help="Seed for the bootstrap resampling (default: %(default)s)")
+    batch = parser.add_argument_group("batch reports")
+    batch.add_argument('--batch', action='store_true',
+                       help="Render the report for every date in the file in parallel")
+    batch.add_argument('--output-dir', default='reports',
+                       help="Directory for per-date batch reports (default: %(default)s)")
+    batch.add_argument('--min-cases-grid', type=_number_list,
+                       help="Comma-separated minimum case thresholds (default: --min-cases)")
+    batch.add_argument('--testing-threshold-grid', type=_number_list,
+                       help="Comma-separated testing thresholds (default: --testing-threshold)")
+    batch.add_argument('--jobs', type=int, default=os.cpu_count(),
+                       help="Worker processes for batch mode (default: %(default)s)")
+    sweep = parser.add_argument_group("threshold sweep")
+    sweep.add_argument('--sweep', metavar='PATH',
+                       help="Write the estimate for every minimum case and testing threshold "
+                            "combination on --date to a CSV file")
+    sweep.add_argument('--sweep-all-dates', action='store_true',
+                       help="Sweep every date in the file instead of only --date")
+    instrumentation = parser.add_argument_group("instrumentation")
+    instrumentation.add_argument('--timing', action='store_true',
+                                 help="Print how long each stage took (also enabled by COVID_TIMING=1)")
+    instrumentation.add_argument('--timing-jsonl', metavar='PATH',
+                                 help="Append the stage timings of this run to a JSON lines file")
+    instrumentation.add_argument('--profile', metavar='PATH',
+                                 help="Write a cProfile dump of the run (default: $COVID_PROFILE)")
+    return parser.parse_args()
+
+
+def _number_list(text):
+    try:
+        return [float(value) if '.' in value else int(value) for value in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated numbers, got {text!r}")
+
+
+def load_data(args, date):
+    """Return the rows for the analysis date and for the example country."""
+    if args.streaming:
+        # Single pass over the file keeping only the rows we need
+        print(f"Streaming data in chunks of {args.chunksize} rows...")
+        kept_df = stream_snapshots(args.csv, dates=[date], countries=[args.country],
+                                   chunksize=args.chunksize)
+        print("Rows kept:", len(kept_df))
+        add_derived_metrics(kept_df)
+        date_df = kept_df.loc[kept_df['Date'] == date, :].reset_index(drop=True)
+        country_df = kept_df.loc[kept_df['Country'] == args.country, :].reset_index(drop=True)
+        return date_df, country_df
+
+    # Load the main data table, index its rows by date and compute derived metrics
+    print("Loading data...")
+    snapshots = SnapshotIndex.from_csv(args.csv)
+    worldometer_df = snapshots.df
+    print("Data shape:", worldometer_df.shape)
+    print("\nFirst few rows of the dataset:")
+    print(worldometer_df.head())
+
+    # Example of filtering by country
+    country_df = worldometer_df.loc[worldometer_df['Country'] == args.country, :].reset_index(drop=True)
+    if date in snapshots:
+        date_df = snapshots.get_date(date).reset_index(drop=True)
+    else:
+        date_df = worldometer_df.iloc[0:0]
+    return date_df, country_df
+
+
+def _write_png(path, png):
+    with open(path, 'wb') as f:
+        f.write(png)
+
+
+def analyze(last_date_df, min_number_of_cases, good_testing_threshold, timer=None,
+            resamples=BOOTSTRAP_RESAMPLES, seed=BOOTSTRAP_SEED, plot_cache=None):
+    # Naive death rate and tests per positive case for each country are
+    # precomputed columns (see covid_data.add_derived_metrics)
+    timer = timer or StageTimer('analyze', enabled=False)
+
+    # Plot histogram of death rates
+    with timer.span('histogram'):
+        _write_png('death_rate_histogram.png',
+                   histogram_png(last_date_df, 'Histogram of Death Rates for various Countries', plot_cache))
+    print("\nCreated death rate histogram")
+
+    # Filter out countries with small number of cases
+    with timer.span('filter'):
+        greatly_affected_df = last_date_df.loc[last_date_df['Total Cases'] > min_number_of_cases,:]
+
+    # Plot histogram for countries with significant cases
+    with timer.span('filtered_histogram'):
+        _write_png('death_rate_histogram_filtered.png',
+                   histogram_png(greatly_affected_df,
+                                 f'Histogram of Death Rates for Countries with >{min_number_of_cases} Cases',
+                                 plot_cache))
+    print("\nCreated filtered death rate histogram")
+
+    # Plot scatter of death rate as function of testing quality
+    with timer.span('scatter'):
+        _write_png('death_rate_vs_testing.png',
+                   scatter_png(greatly_affected_df, countries_to_display, plot_cache))
+    print("\nCreated scatter plot of death rate vs testing quality")
+
+    # Look at data from best testing countries
+    with timer.span('good_testing'):
+        good_testing_df = greatly_affected_df.loc[greatly_affected_df['Num Tests per Positive Case'] > good_testing_threshold,:]
+    print(f"\nCountries with good testing (>{good_testing_threshold:g} tests per positive case):")
+    print(good_testing_df[['Country', 'Total Cases', 'Total Deaths', 'Total Tests', 'Num Tests per Positive Case', 'Case Fatality Ratio']].head())
+
+    # Calculate the death rate for these countries
+    with timer.span('estimate'):
+        estimated_death_rate_percent = 100 * good_testing_df['Total Deaths'].sum() / good_testing_df['Total Cases'].sum()
+    print(f'\nDeath Rate only for "good testing countries" is {estimated_death_rate_percent:.2f}%')
+
+    # Uncertainty from which countries happen to have good testing
+    with timer.span('bootstrap'):
+        interval = bootstrap_death_rate(good_testing_df['Total Deaths'].to_numpy(dtype=float, na_value=np.nan),
+                                        good_testing_df['Total Cases'].to_numpy(dtype=float, na_value=np.nan),
+                                        resamples=resamples, seed=seed)
+    print(f"{interval.confidence:.0%} confidence interval (bootstrap over {len(good_testing_df)} countries, "
+          f"{interval.resamples} resamples): {interval.low:.2f}% to {interval.high:.2f}%")
+    return estimated_death_rate_percent
+
+
+# Snapshot data loaded once per batch worker process
+_worker_snapshots = None
+_worker_query = None
+_worker_plot_cache = None
+
+
+def _init_batch_worker(csv_path, use_plot_cache=True):
+    global _worker_snapshots, _worker_query, _worker_plot_cache
+    _worker_snapshots = SnapshotIndex.from_csv(csv_path)
+    _worker_query = DeathRateQuery(_worker_snapshots)
+    # Workers share the disk cache; each keeps its own memory tier
+    if use_plot_cache:
+        _worker_plot_cache = PlotCache(plot_cache_dir(csv_path))
+
+
+def render_date_report(date, min_cases, testing_thresholds, output_dir, include_overall):
+    """Render the report for one date and case threshold in a worker process.
+
+    Returns one summary row per testing threshold.
+    """
+    date_df = _worker_snapshots.get_date(date)
+    date_dir = os.path.join(output_dir, date)
+    case_dir = os.path.join(date_dir, f'min_cases_{min_cases}')
+    os.makedirs(case_dir, exist_ok=True)
+
+    if include_overall:
+        _write_png(os.path.join(date_dir, 'death_rate_histogram.png'),
+                   histogram_png(date_df, f'Histogram of Death Rates for various Countries ({date})',
+                                 _worker_plot_cache))
+
+    greatly_affected_df = date_df.loc[date_df['Total Cases'] > min_cases, :]
+    _write_png(os.path.join(case_dir, 'death_rate_histogram_filtered.png'),
+               histogram_png(greatly_affected_df,
+                             f'Histogram of Death Rates for Countries with >{min_cases} Cases ({date})',
+                             _worker_plot_cache))
+    _write_png(os.path.join(case_dir, 'death_rate_vs_testing.png'),
+               scatter_png(greatly_affected_df, countries_to_display, _worker_plot_cache))
+
+    rows = []
+    for testing_threshold in testing_thresholds:
+        estimate = _worker_query.estimate(date, min_cases, testing_threshold)
+        interval = _worker_query.confidence_interval(date, min_cases, testing_threshold)
+        rows.append({
+            'Date': date,
+            'Min Cases': min_cases,
+            'Testing Threshold': testing_threshold,
+            'Countries Above Min Cases': len(greatly_affected_df),
+            'Good Testing Countries': estimate.countries,
+            'Good Testing Deaths': estimate.deaths,
+            'Good Testing Cases': estimate.cases,
+            'Estimated Death Rate (%)': estimate.death_rate,
+            'CI Low (%)': interval.low,
+            'CI High (%)': interval.high,
+        })
+    return rows
+
+
+def run_batch(args):
+    min_cases_grid = args.min_cases_grid or [args.min_cases]
+    testing_threshold_grid = args.testing_threshold_grid or [args.testing_threshold]
+    dates = SnapshotIndex.from_csv(args.csv).dates
+    print(f"Rendering reports for {len(dates)} dates x {len(min_cases_grid)} case thresholds "
+          f"with {args.jobs} worker processes...")
+
+    summary_rows = []
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_batch_worker,
+                             initargs=(args.csv, not args.no_plot_cache)) as executor:
+        futures = [executor.submit(render_date_report, date, min_cases, testing_threshold_grid,
+                                   args.output_dir, i == 0)
+                   for date in dates
+                   for i, min_cases in enumerate(min_cases_grid)]
+        for future in futures:
+            summary_rows.extend(future.result())
+
+    summary_df = pd.DataFrame(summary_rows)
+    summary_path = os.path.join(args.output_dir, 'summary.csv')
+    summary_df.to_csv(summary_path, index=False)
+    print(f"Wrote reports to {args.output_dir} and estimates to {summary_path}")
+    return summary_df
+
+
+def run_sweep(args, date):
+    snapshots = SnapshotIndex.from_csv(args.csv)
+    if not args.sweep_all_dates and date not in snapshots:
+        print(f"\nNo data available for {date}")
+        return None
+    dates = snapshots.dates if args.sweep_all_dates else [date]
+    sweep_df = threshold_sweep(snapshots, dates).to_frame()
+    sweep_df.to_csv(args.sweep, index=False)
+    print(f"Wrote {len(sweep_df)} threshold combinations for {len(dates)} date(s) to {args.sweep}")
+    return sweep_df
+
+
+def main():
+    args = parse_args()
+    timer = StageTimer('cli_run', enabled=True if args.timing or args.timing_jsonl else None,
+                       jsonl_path=args.timing_jsonl)
+    with ProfileDump(args.profile):
+        run(args, timer)
+    if timer.enabled:
+        print(f"\nStage timings: {timer.summary()} (total {1000 * timer.total:.1f} ms)")
+        timer.record(csv=args.csv, date=args.date, min_cases=args.min_cases,
+                     testing_threshold=args.testing_threshold, batch=args.batch)
+
+
+def run(args, timer):
+    if args.batch:
+        with timer.span('batch'):
+            run_batch(args)
+        return
+
+    last_date = datetime.strptime(args.date, '%d/%m/%Y')
+    date = last_date.strftime('%Y-%m-%d')
+
+    if args.sweep:
+        with timer.span('sweep'):
+            run_sweep(args, date)
+        return
+
+    with timer.span('load'):
+        last_date_df, country_df = load_data(args, date)
+    print(f"\nData for {args.country}:")
+    print(country_df.head())
+
+    # Analysis using the selected date
+    print(f"\nData for the last date {date}:")
+    print(last_date_df.head())
+    if last_date_df.empty:
+        print(f"\nNo data available for {date}")
+        return
+
+    plot_cache = None if args.no_plot_cache else PlotCache(plot_cache_dir(args.csv))
+    analyze(last_date_df, args.min_cases, args.testing_threshold, timer, args.resamples, args.seed,
+            plot_cache)
+
+
+if __name__ == "__main__":
+    main()
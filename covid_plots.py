@@ -0,0 +1,110 @@
+from io import BytesIO
+
+import matplotlib
+import numpy as np
+from matplotlib.figure import Figure
+
+from covid_cache import content_key
+from covid_data import X_AXIS_LIMIT
+
+# Histogram bins for death rates in percent
+HISTOGRAM_BINS = np.arange(35)
+
+# Bump when the figures change so cached images are rendered again
+PLOT_CACHE_VERSION = 1
+PLOT_CACHE_SUFFIX = '.plotcache'
+
+
+def plot_cache_dir(path):
+    """Return the directory of rendered plots for the snapshot CSV ``path``."""
+    return path + PLOT_CACHE_SUFFIX
+
+
+def label_positions(countries, countries_to_display):
+    """Return {country: first row position} for the displayed countries
+    present in ``countries``."""
+    # Built back to front, so the first row of a repeated country wins
+    first_rows = dict(zip(countries[::-1], range(len(countries) - 1, -1, -1)))
+    return {country: first_rows[country] for country in countries_to_display if country in first_rows}
+
+
+def figure_png(fig, bbox_inches=None):
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches=bbox_inches)
+    return buffer.getvalue()
+
+
+def _plot_key(kind, *parts):
+    return content_key(kind, PLOT_CACHE_VERSION, matplotlib.__version__, *parts)
+
+
+def histogram_figure(df, title, figsize=(12, 8), label_size=16, title_size=18):
+    """Return a Figure with the histogram of death rates in ``df``.
+
+    Uses a standalone Figure rather than pyplot, so it is safe to build in
+    worker processes and is freed as soon as it goes out of scope.
+    """
+    fig = Figure(figsize=figsize)
+    ax = fig.add_subplot()
+    ax.hist(df['Death Rate (%)'].to_numpy(), bins=HISTOGRAM_BINS)
+    ax.set_xlabel('Death Rate (%)', fontsize=label_size)
+    ax.set_ylabel('Number of Countries', fontsize=label_size)
+    ax.set_title(title, fontsize=title_size)
+    return fig
+
+
+# Columns drawn by scatter_figure()
+SCATTER_COLUMNS = ['Country', 'Death Rate (%)', 'Tests Per Case', 'Log Population', 'Log Deaths']
+
+
+def scatter_figure(df, countries_to_display=(), figsize=(16, 12), label_size=16, title_size=18):
+    """Return a Figure of death rate against tests per positive case."""
+    death_rate_percent = df['Death Rate (%)'].to_numpy()
+    num_test_per_positive = df['Tests Per Case'].to_numpy()
+
+    fig = Figure(figsize=figsize)
+    ax = fig.add_subplot()
+    scatter = ax.scatter(x=num_test_per_positive, y=death_rate_percent,
+                         s=0.5*np.power(df['Log Population'].to_numpy(),2),
+                         c=df['Log Deaths'].to_numpy())
+    fig.colorbar(scatter, ax=ax)
+    ax.set_ylabel('Death Rate (%)', fontsize=label_size)
+    ax.set_xlabel('Number of Tests per Positive Case', fontsize=label_size)
+    ax.set_title('Death Rate as function of Testing Quality', fontsize=title_size)
+    ax.set_xlim(-1, X_AXIS_LIMIT + 12)
+    ax.set_ylim(-0.2,17)
+
+    # Plot country names on the scatter plot
+    positions = label_positions(df['Country'].to_numpy(dtype=object), countries_to_display)
+    for country_name, country_index in positions.items():
+        ax.text(x=num_test_per_positive[country_index] + 0.5,
+                y=death_rate_percent[country_index] + 0.2,
+                s=country_name, fontsize=10)
+    return fig
+
+
+def histogram_png(df, title, cache=None, bbox_inches=None, **figure_kwargs):
+    """Return histogram_figure() as PNG bytes, from ``cache`` if it has them.
+
+    The key covers the death rates and every plot parameter, so the image
+    is shared by all callers that would render the same picture.
+    """
+    def render():
+        return figure_png(histogram_figure(df, title, **figure_kwargs), bbox_inches)
+    if cache is None:
+        return render()
+    key = _plot_key('histogram', df['Death Rate (%)'].to_numpy(), title, bbox_inches,
+                    sorted(figure_kwargs.items()))
+    return cache.get_or_render(key, render)
+
+
+def scatter_png(df, countries_to_display=(), cache=None, bbox_inches=None, **figure_kwargs):
+    """Return scatter_figure() as PNG bytes, from ``cache`` if it has them."""
+    def render():
+        return figure_png(scatter_figure(df, countries_to_display, **figure_kwargs), bbox_inches)
+    if cache is None:
+        return render()
+    key = _plot_key('scatter', *(df[name].to_numpy(dtype=object if name == 'Country' else None)
+                                 for name in SCATTER_COLUMNS),
+                    tuple(countries_to_display), bbox_inches, sorted(figure_kwargs.items()))
+    return cache.get_or_render(key, render)
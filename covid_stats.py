@@ -0,0 +1,421 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from covid_data import format_dates
+
+# Result of a good-testing death rate query; death_rate is in percent and
+# NaN when no country passes both thresholds
+DeathRateEstimate = namedtuple('DeathRateEstimate', ['death_rate', 'countries', 'deaths', 'cases'])
+
+# Bootstrap confidence interval of the death rate in percent; NaN bounds
+# when no country passes the thresholds
+DeathRateInterval = namedtuple('DeathRateInterval', ['low', 'high', 'confidence', 'resamples'])
+
+# Bootstrap defaults: the fixed seed makes intervals reproducible
+BOOTSTRAP_RESAMPLES = 2000
+CONFIDENCE_LEVEL = 0.95
+BOOTSTRAP_SEED = 0
+
+# Resampled country indices held in memory at once, to bound memory use
+# when there are many countries
+_BOOTSTRAP_BLOCK_CELLS = 1 << 22
+
+
+def bootstrap_death_rate(deaths, cases, resamples=BOOTSTRAP_RESAMPLES,
+                         confidence=CONFIDENCE_LEVEL, seed=BOOTSTRAP_SEED):
+    """Percentile bootstrap interval for 100 * sum(deaths) / sum(cases).
+
+    Countries are resampled with replacement. Each block of resamples is
+    one (resamples x countries) matrix of random country indices, and the
+    resampled death and case totals are row sums over it, with no Python
+    loop over resamples.
+    """
+    deaths = np.nan_to_num(np.asarray(deaths, dtype=float))
+    cases = np.asarray(cases, dtype=float)
+    n = len(cases)
+    if n == 0 or not np.nansum(cases) > 0:
+        return DeathRateInterval(float('nan'), float('nan'), confidence, resamples)
+    cases = np.nan_to_num(cases)
+
+    rng = np.random.default_rng(seed)
+    block = max(1, _BOOTSTRAP_BLOCK_CELLS // n)
+    rates = []
+    for start in range(0, resamples, block):
+        indices = rng.integers(0, n, size=(min(block, resamples - start), n))
+        resampled_cases = cases[indices].sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates.append(100 * deaths[indices].sum(axis=1) / resampled_cases)
+    rates = np.concatenate(rates)
+    alpha = (1 - confidence) / 2
+    low, high = np.nanquantile(rates, [alpha, 1 - alpha])
+    return DeathRateInterval(float(low), float(high), confidence, resamples)
+
+
+class _ThresholdTree:
+    """Merge-sort tree answering 2-D threshold sums for one date.
+
+    Countries are ordered by ``Total Cases``. Each level splits that order
+    into blocks of ``2**level`` countries, and every block keeps its
+    tests-per-case values sorted together with running sums of deaths and
+    cases. A query for ``cases > min_cases and tests_per_case > threshold``
+    becomes one binary search for the case-count suffix, then one binary
+    search in each of the O(log n) blocks covering it.
+    """
+
+    def __init__(self, cases, deaths, tests_per_case):
+        cases = np.asarray(cases, dtype=float)
+        deaths = np.nan_to_num(np.asarray(deaths, dtype=float))
+        tests_per_case = np.asarray(tests_per_case, dtype=float)
+
+        # Rows with missing values can never pass a ">" threshold
+        cases_key = np.where(np.isnan(cases), -np.inf, cases)
+        tpc_key = np.where(np.isnan(tests_per_case), -np.inf, tests_per_case)
+
+        order = np.argsort(cases_key, kind='stable')
+        self.n = len(order)
+        self.sorted_cases = cases_key[order]
+
+        size = 1
+        while size < max(self.n, 1):
+            size *= 2
+        self.size = size
+        # Padding rows sort first in every block and never pass a threshold
+        tpc = np.full(size, -np.inf)
+        tpc[:self.n] = tpc_key[order]
+        case_counts = np.zeros(size)
+        case_counts[:self.n] = np.where(np.isnan(cases), 0.0, cases)[order]
+        death_counts = np.zeros(size)
+        death_counts[:self.n] = deaths[order]
+
+        self.levels = []
+        block = 1
+        while block <= size:
+            blocks = tpc.reshape(-1, block)
+            within = np.argsort(blocks, axis=1, kind='stable')
+            flat = (within + np.arange(0, size, block)[:, None]).ravel()
+            self.levels.append((
+                tpc[flat],
+                np.r_[0.0, np.cumsum(death_counts[flat])],
+                np.r_[0.0, np.cumsum(case_counts[flat])],
+            ))
+            block *= 2
+
+    def query(self, min_cases, testing_threshold):
+        """Return (countries, deaths, cases) over rows passing both thresholds."""
+        pos = int(np.searchsorted(self.sorted_cases, min_cases, side='right'))
+        countries = 0
+        deaths = 0.0
+        cases = 0.0
+        while pos < self.n:
+            # Largest aligned block starting at pos
+            level = (pos & -pos).bit_length() - 1 if pos else len(self.levels) - 1
+            block = 1 << level
+            tpc, cum_deaths, cum_cases = self.levels[level]
+            first = pos + int(np.searchsorted(tpc[pos:pos + block], testing_threshold, side='right'))
+            end = pos + block
+            countries += end - first
+            deaths += cum_deaths[end] - cum_deaths[first]
+            cases += cum_cases[end] - cum_cases[first]
+            pos = end
+        return countries, deaths, cases
+
+
+class DeathRateQuery:
+    """Good-testing death rate estimates for (date, min_cases, threshold).
+
+    Built on a ``covid_data.SnapshotIndex``. The per-date structure is
+    created on the first query for that date, after which each estimate
+    takes logarithmic time in the number of countries, cheap enough to
+    refresh while a slider is being dragged. Appended dates need no
+    invalidation, since their structures are built on first use.
+    """
+
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self._trees = {}
+        self._generation = snapshots.generation
+
+    def _tree(self, date):
+        if self._generation != self.snapshots.generation:
+            # The snapshots were reloaded, so every date may have changed
+            self._trees = {}
+            self._generation = self.snapshots.generation
+        tree = self._trees.get(date)
+        if tree is None:
+            tree = _ThresholdTree(
+                self.snapshots.column(date, 'Total Cases'),
+                self.snapshots.column(date, 'Total Deaths'),
+                self.snapshots.column(date, 'Num Tests per Positive Case'),
+            )
+            self._trees[date] = tree
+        return tree
+
+    def invalidate(self, date=None):
+        """Drop the structure for ``date``, or for every date."""
+        if date is None:
+            self._trees.clear()
+        else:
+            self._trees.pop(date, None)
+
+    def estimate(self, date, min_cases, testing_threshold):
+        """Return the DeathRateEstimate for countries with more than
+        ``min_cases`` cases and more than ``testing_threshold`` tests per
+        positive case on ``date``."""
+        countries, deaths, cases = self._tree(date).query(min_cases, testing_threshold)
+        death_rate = 100 * deaths / cases if cases > 0 else float('nan')
+        return DeathRateEstimate(death_rate, countries, deaths, cases)
+
+    def confidence_interval(self, date, min_cases, testing_threshold, resamples=BOOTSTRAP_RESAMPLES,
+                            confidence=CONFIDENCE_LEVEL, seed=BOOTSTRAP_SEED):
+        """Return the bootstrap DeathRateInterval for the countries that
+        estimate() uses."""
+        cases = self.snapshots.column(date, 'Total Cases')
+        tests_per_case = self.snapshots.column(date, 'Num Tests per Positive Case')
+        with np.errstate(invalid='ignore'):
+            good = (cases > min_cases) & (tests_per_case > testing_threshold)
+        deaths = self.snapshots.column(date, 'Total Deaths')
+        return bootstrap_death_rate(deaths[good], cases[good], resamples, confidence, seed)
+
+
+# Default grid of the threshold sweep, matching the dashboard slider steps
+SWEEP_MIN_CASES = np.arange(100, 10001, 100)
+SWEEP_THRESHOLDS = np.arange(5, 101, 5)
+
+
+class ThresholdSweep:
+    """Good-testing estimates over a grid of (min_cases, threshold) pairs.
+
+    ``countries``, ``deaths``, ``cases`` and ``death_rate`` are arrays of
+    shape (dates, min cases, thresholds); death_rate is in percent and NaN
+    where no country passes both thresholds.
+    """
+
+    def __init__(self, dates, min_cases, thresholds, countries, deaths, cases):
+        self.dates = dates
+        self.min_cases = min_cases
+        self.thresholds = thresholds
+        self.countries = countries
+        self.deaths = deaths
+        self.cases = cases
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.death_rate = np.where(cases > 0, 100 * deaths / np.where(cases > 0, cases, 1), np.nan)
+
+    def to_frame(self):
+        """Return one row per date, min cases and threshold."""
+        dates, min_cases, thresholds = np.meshgrid(np.asarray(self.dates, dtype=object), self.min_cases,
+                                                   self.thresholds, indexing='ij')
+        return pd.DataFrame({
+            'Date': dates.ravel(),
+            'Min Cases': min_cases.ravel(),
+            'Testing Threshold': thresholds.ravel(),
+            'Good Testing Countries': self.countries.ravel(),
+            'Good Testing Deaths': self.deaths.ravel(),
+            'Good Testing Cases': self.cases.ravel(),
+            'Estimated Death Rate (%)': self.death_rate.ravel(),
+        })
+
+
+def threshold_sweep(snapshots, dates=None, min_cases_grid=SWEEP_MIN_CASES, threshold_grid=SWEEP_THRESHOLDS):
+    """Compute the good-testing estimate for every grid cell and date at once.
+
+    A country passes the cells whose min cases is below its case count and
+    whose threshold is below its tests per positive case, i.e. a corner
+    rectangle of the grid found with two binary searches. Each country is
+    added at its rectangle corner in a (dates x grid) histogram, and
+    suffix sums along both grid axes turn that into the totals for every
+    cell, in O(rows + dates x grid) without looping over the grid.
+    ``dates`` defaults to every date of ``snapshots``.
+    """
+    dates = list(snapshots.dates if dates is None else dates)
+    min_cases_grid = np.unique(min_cases_grid)
+    threshold_grid = np.unique(threshold_grid)
+    num_min, num_thresholds = len(min_cases_grid), len(threshold_grid)
+
+    def gather(name):
+        # One column for every requested date, as floats
+        return np.concatenate([np.zeros(0)] + [snapshots.column(date, name) for date in dates]).astype(float)
+
+    rows_per_date = [stop - start for start, stop in map(snapshots.date_range, dates)]
+    date_codes = np.repeat(np.arange(len(dates)), rows_per_date).astype(np.intp)
+    cases = gather('Total Cases')
+    deaths = np.nan_to_num(gather('Total Deaths'))
+    tests_per_case = gather('Num Tests per Positive Case')
+
+    # Number of grid values each country is above; missing values pass none
+    min_index = np.searchsorted(min_cases_grid, np.where(np.isnan(cases), -np.inf, cases), side='left')
+    threshold_index = np.searchsorted(threshold_grid, np.where(np.isnan(tests_per_case), -np.inf, tests_per_case),
+                                      side='left')
+    cell = (date_codes * (num_min + 1) + min_index) * (num_thresholds + 1) + threshold_index
+    shape = (len(dates), num_min + 1, num_thresholds + 1)
+
+    def grid_totals(weights):
+        corners = np.bincount(cell, weights, minlength=int(np.prod(shape))).reshape(shape)
+        totals = np.flip(np.flip(corners, (1, 2)).cumsum(axis=1).cumsum(axis=2), (1, 2))
+        # Cell (i, j) gathers countries whose corner is past both i and j
+        return totals[:, 1:, 1:]
+
+    return ThresholdSweep(
+        dates, min_cases_grid, threshold_grid,
+        countries=grid_totals(None).astype(np.int64),
+        deaths=grid_totals(deaths),
+        cases=grid_totals(np.nan_to_num(cases)),
+    )
+
+
+# Days in the rolling windows of the time-series metrics
+ROLLING_WINDOW = 7
+
+
+class CountryTimeSeries:
+    """Country x date matrices of the cumulative snapshot counts.
+
+    The snapshots are pivoted once into dense matrices (NaN where a country
+    is missing on a date), and daily deltas and rolling ratios are computed
+    for all countries at once with array operations along the date axis.
+    The rolling ratios cover the last ``window`` days: new deaths over new
+    cases, and new tests over new cases.
+
+    New dates are added with extend(), which only computes the metrics for
+    the new date columns. The new matrices are swapped in together under a
+    lock that the readers also take, so sessions reading while another one
+    extends never see dates and metrics of different lengths.
+    """
+
+    count_columns = ['Total Cases', 'Total Deaths', 'Total Tests']
+
+    def __init__(self, df, window=ROLLING_WINDOW):
+        self.window = window
+        self.countries = np.array([], dtype=object)
+        self.dates = []
+        self._country_positions = {}
+        self._date_positions = {}
+        self.totals = {name: np.empty((0, 0)) for name in self.count_columns}
+        self.metrics = {}
+        self.generation = None
+        self._lock = threading.RLock()
+        self.extend(df)
+
+    @classmethod
+    def from_snapshots(cls, snapshots, window=ROLLING_WINDOW):
+        time_series = cls(snapshots.df, window)
+        time_series.generation = snapshots.generation
+        return time_series
+
+    def sync(self, snapshots):
+        """Add any dates of ``snapshots`` that are not in the matrices yet.
+
+        Returns the dates that were added.
+        """
+        with self._lock:
+            if self.generation != snapshots.generation:
+                # The snapshots were reloaded from scratch, so start over too
+                fresh = CountryTimeSeries(snapshots.df, self.window)
+                self._swap(fresh.countries, fresh.dates, fresh._country_positions,
+                           fresh._date_positions, fresh.totals, fresh.metrics)
+                self.generation = snapshots.generation
+                return list(self.dates)
+            missing = [date for date in snapshots.dates if date not in self._date_positions]
+            if missing:
+                self.extend(pd.concat([snapshots.get_date(date) for date in missing]))
+            return missing
+
+    def extend(self, df):
+        """Add the rows of ``df``, whose dates must follow the current ones."""
+        if df.empty:
+            return
+        # Dates are keyed by their 'YYYY-MM-DD' labels, as in SnapshotIndex
+        date_codes, unique_dates = pd.factorize(df['Date'], sort=True)
+        new_dates = format_dates(unique_dates)
+        if self.dates and new_dates[0] <= self.dates[-1]:
+            raise ValueError(f"New dates must be after {self.dates[-1]}")
+
+        # Countries seen for the first time get new rows at the bottom
+        new_countries = np.array(sorted(set(df['Country']) - set(self.countries)), dtype=object)
+        countries = np.concatenate([self.countries, new_countries])
+        country_positions = dict(self._country_positions)
+        country_positions.update(
+            (country, len(self.countries) + i) for i, country in enumerate(new_countries))
+        date_positions = dict(self._date_positions)
+        date_positions.update((date, len(self.dates) + i) for i, date in enumerate(new_dates))
+
+        country_codes = pd.Index(countries).get_indexer(df['Country'])
+        num_countries, num_new = len(countries), len(new_dates)
+        totals = {}
+        for name in self.count_columns:
+            block = np.full((num_countries, num_new), np.nan)
+            block[country_codes, date_codes] = df[name].to_numpy(dtype=float, na_value=np.nan)
+            totals[name] = np.hstack([_pad_rows(self.totals[name], num_countries), block])
+
+        # Metrics for the new columns only need the preceding ``window`` days
+        context = {name: matrix[:, -(num_new + self.window):] for name, matrix in totals.items()}
+        new_metrics = _time_series_metrics(context['Total Cases'], context['Total Deaths'],
+                                           context['Total Tests'], self.window)
+        metrics = {}
+        for name, matrix in new_metrics.items():
+            old = self.metrics.get(name, np.empty((0, 0)))
+            metrics[name] = np.hstack([_pad_rows(old, num_countries), matrix[:, -num_new:]])
+        self._swap(countries, self.dates + new_dates, country_positions, date_positions, totals, metrics)
+
+    def _swap(self, countries, dates, country_positions, date_positions, totals, metrics):
+        with self._lock:
+            self.countries = countries
+            self.dates = dates
+            self._country_positions = country_positions
+            self._date_positions = date_positions
+            self.totals = totals
+            self.metrics = metrics
+
+    def metric_frame(self, metric):
+        """Return one metric as a country x date DataFrame."""
+        with self._lock:
+            return pd.DataFrame(self.metrics[metric], index=self.countries, columns=self.dates)
+
+    def country_frame(self, country):
+        """Return every metric for one country as a date-indexed DataFrame."""
+        with self._lock:
+            row = self._country_positions[country]
+            return pd.DataFrame({name: matrix[row] for name, matrix in self.metrics.items()},
+                                index=pd.Index(self.dates, name='Date'))
+
+
+def _time_series_metrics(cases, deaths, tests, window):
+    metrics = {
+        'Total Cases': cases,
+        'Total Deaths': deaths,
+        'Total Tests': tests,
+        'New Cases': _lagged_difference(cases, 1),
+        'New Deaths': _lagged_difference(deaths, 1),
+        'New Tests': _lagged_difference(tests, 1),
+    }
+    # Rolling ratios use the change in the cumulative totals over the window
+    window_cases = _lagged_difference(cases, window)
+    window_deaths = _lagged_difference(deaths, window)
+    window_tests = _lagged_difference(tests, window)
+    metrics['Rolling CFR (%)'] = 100 * _safe_ratio(window_deaths, window_cases)
+    metrics['Rolling Tests per Positive'] = _safe_ratio(window_tests, window_cases)
+    metrics['Tests per Positive Case'] = _safe_ratio(tests, cases)
+    return metrics
+
+
+def _pad_rows(matrix, num_rows):
+    # Add NaN rows for countries that were not in ``matrix`` yet
+    padded = np.full((num_rows, matrix.shape[1]), np.nan)
+    padded[:matrix.shape[0]] = matrix
+    return padded
+
+
+def _lagged_difference(matrix, lag):
+    # Change over ``lag`` days along the date axis; NaN for the first days
+    result = np.full(matrix.shape, np.nan)
+    if matrix.shape[1] > lag:
+        result[:, lag:] = matrix[:, lag:] - matrix[:, :-lag]
+    return result
+
+
+def _safe_ratio(numerator, denominator):
+    # NaN wherever the denominator is not positive
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / np.where(denominator > 0, denominator, 1), np.nan)
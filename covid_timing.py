@@ -0,0 +1,138 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Set to 1 to time the stages of every update
+TIMING_ENV = 'COVID_TIMING'
+# Path of a JSON lines file that receives one line per timed update
+TIMING_JSONL_ENV = 'COVID_TIMING_JSONL'
+# Path of a cProfile dump (read with pstats or snakeviz)
+PROFILE_ENV = 'COVID_PROFILE'
+
+_jsonl_lock = threading.Lock()
+
+
+def timing_enabled():
+    return bool(os.environ.get(TIMING_ENV)) or bool(os.environ.get(TIMING_JSONL_ENV))
+
+
+class StageTimer:
+    """Named timing spans for one update, e.g. filtering, plotting, tables.
+
+    Instrumentation is opt-in: when disabled, span() does nothing beyond
+    entering a context manager. Enabled timers can be summarized for a
+    status line and appended to a JSON lines file.
+    """
+
+    def __init__(self, label, enabled=None, jsonl_path=None):
+        self.label = label
+        self.enabled = timing_enabled() if enabled is None else enabled
+        self.jsonl_path = jsonl_path or os.environ.get(TIMING_JSONL_ENV)
+        self.spans = []
+
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, time.perf_counter() - start))
+
+    def add(self, name, seconds):
+        """Record a span measured elsewhere, e.g. between two milestones."""
+        if self.enabled:
+            self.spans.append((name, seconds))
+
+    @property
+    def total(self):
+        return sum(seconds for _, seconds in self.spans)
+
+    def as_dict(self):
+        # Repeated span names (e.g. one per loop iteration) are added up
+        totals = {}
+        for name, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def summary(self):
+        """Return the spans as a short 'name 1.2 ms, ...' string."""
+        return ', '.join(f"{name} {1000 * seconds:.1f} ms" for name, seconds in self.as_dict().items())
+
+    def record(self, **context):
+        """Append the spans and ``context`` as one line to the JSON lines file."""
+        if not (self.enabled and self.jsonl_path and self.spans):
+            return
+        line = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'label': self.label,
+            'context': context,
+            'spans_ms': {name: 1000 * seconds for name, seconds in self.as_dict().items()},
+            'total_ms': 1000 * self.total,
+        }
+        with _jsonl_lock, open(self.jsonl_path, 'a') as f:
+            f.write(json.dumps(line, default=str) + '\n')
+
+
+class ProfileDump:
+    """cProfile session written to ``path`` when stopped; a no-op without a path.
+
+    The thread that starts the session is profiled throughout. Work on other
+    threads is profiled when it goes through run(), and the calls finished
+    before stop() are dumped together with the starting thread.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(PROFILE_ENV)
+        self._profile = None
+        self._lock = threading.Lock()
+        self._thread_profiles = []
+
+    def start(self):
+        if self.path and self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def run(self, fn, *args, **kwargs):
+        """Call ``fn``, profiled into this session while it is running."""
+        if self._profile is None:
+            return fn(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one profiler at a time, and the session's
+            # already covers every thread
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._lock:
+                if self._profile is not None:
+                    self._thread_profiles.append(profile)
+
+    def stop(self):
+        if self._profile is not None:
+            self._profile.disable()
+            with self._lock:
+                stats = pstats.Stats(self._profile)
+                for profile in self._thread_profiles:
+                    stats.add(profile)
+                self._profile = None
+                self._thread_profiles = []
+            stats.dump_stats(self.path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
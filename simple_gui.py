@@ -1,48 +1,349 @@
+import time
+_MODULE_START = time.perf_counter()
+
+import argparse
 import tkinter as tk
 from tkinter import ttk
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import pandas as pd
-import numpy as np
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 from datetime import datetime
 
+from covid_timing import ProfileDump, StageTimer
+
+# numpy, pandas, matplotlib and the data modules take most of the startup
+# time, so they are imported on first use rather than here
+np = None
+pd = None
+Figure = None
+FigureCanvasTkAgg = None
+covid_data = None
+covid_stats = None
+covid_plots = None
+
+
+def _import_data_modules():
+    global np, pd, covid_data, covid_stats, covid_plots
+    import numpy as np
+    import pandas as pd
+    import covid_data
+    import covid_stats
+    import covid_plots
+
+
+def _import_plot_modules():
+    # Names that are already set (e.g. replaced for headless runs) are kept
+    global Figure, FigureCanvasTkAgg
+    if Figure is None:
+        from matplotlib.figure import Figure
+    if FigureCanvasTkAgg is None:
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+# Delay before an update starts, so bursts of changes trigger one analysis
+DEBOUNCE_MS = 150
+# How often the main loop checks on the background analysis
+POLL_MS = 50
+# How often the snapshot CSV is checked for newly appended days
+REFRESH_MS = 5000
+# Treeview row height used when the theme does not set one (the Tk default)
+DEFAULT_ROW_HEIGHT = 20
+
+# Notebook tabs, in display order
+HISTOGRAM_TAB, SCATTER_TAB, GOOD_TESTING_TAB, RESULTS_TAB, TRENDS_TAB, SENSITIVITY_TAB = range(6)
+# Tabs that show the results of an analysis
+ANALYSIS_TABS = (HISTOGRAM_TAB, SCATTER_TAB, GOOD_TESTING_TAB, RESULTS_TAB, SENSITIVITY_TAB)
+
+# Countries labelled on the scatter plot
+countries_to_display = ['USA', 'Russia', 'Spain', 'Brazil', 'UK', 'Italy', 'France', 
+                        'Germany', 'India', 'Canada', 'Belgium', 'Mexico', 'Netherlands']
+
+
+class StaleAnalysis(Exception):
+    """Raised in the worker thread when a newer analysis has been requested."""
+
+
+# Good testing table: (column name, display format)
+good_testing_columns = [
+    ('Country', '{}'),
+    ('Total Cases', '{:.0f}'),
+    ('Total Deaths', '{:.0f}'),
+    ('Total Tests', '{:.0f}'),
+    ('Tests/Case', '{:.2f}'),
+    ('Death Rate (%)', '{:.2f}'),
+]
+
+
+class VirtualTable:
+    """Sortable table that only creates Treeview items for the rows in view.
+
+    Rows are held as column arrays. Sorting reorders an index array, and
+    scrolling moves a window over it that reuses a fixed set of Treeview
+    items, so the widget cost depends on the window height rather than the
+    number of rows. set_data() keeps the top row in view when it is still
+    present, and rendering only rewrites items whose displayed values changed.
+    """
+    
+    def __init__(self, parent, columns):
+        self.columns = columns
+        self.frame = ttk.Frame(parent)
+        names = [name for name, _ in columns]
+        self.tree = ttk.Treeview(self.frame, columns=names, show='headings', height=1)
+        for name in names:
+            self.tree.heading(name, text=name, command=lambda name=name: self.sort_by(name))
+            self.tree.column(name, width=100)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        
+        self.tree.bind("<Configure>", self._on_configure)
+        self.tree.bind("<MouseWheel>", lambda e: self._on_wheel(-3 if e.delta > 0 else 3))
+        self.tree.bind("<Button-4>", lambda e: self._on_wheel(-3))
+        self.tree.bind("<Button-5>", lambda e: self._on_wheel(3))
+        
+        self._keys = np.array([], dtype=object)
+        self._data = {name: np.array([]) for name in names}
+        self._order = np.array([], dtype=np.intp)
+        self._sort_column = None
+        self._sort_descending = False
+        self._offset = 0
+        self._visible_rows = 20
+        self._height = None
+        self._measured = False
+        self._items = []
+        self._shown = []
+    
+    def __len__(self):
+        return len(self._keys)
+    
+    def set_data(self, keys, data):
+        """Replace the rows; ``keys`` identifies rows across updates."""
+        keys = np.asarray(keys, dtype=object)
+        data = {name: np.asarray(data[name]) for name, _ in self.columns}
+        
+        # Keep the first visible row in view if it is still present
+        top_key = self._keys[self._order[self._offset]] if self._offset < len(self._order) else None
+        self._keys = keys
+        self._data = data
+        self._apply_sort()
+        if top_key is not None and self._offset:
+            matches = np.flatnonzero(self._keys[self._order] == top_key)
+            self._offset = int(matches[0]) if len(matches) else self._offset
+        self._render()
+    
+    def sort_by(self, name):
+        # Clicking the same heading again reverses the order
+        if self._sort_column == name:
+            self._sort_descending = not self._sort_descending
+        else:
+            self._sort_column = name
+            self._sort_descending = False
+        self._apply_sort()
+        self._render()
+    
+    def _apply_sort(self):
+        if self._sort_column is None:
+            self._order = np.arange(len(self._keys))
+            return
+        values = self._data[self._sort_column]
+        if values.dtype.kind in 'biuf':
+            # Negate rather than reverse so missing values stay at the bottom
+            self._order = np.argsort(-values if self._sort_descending else values, kind='stable')
+        else:
+            self._order = np.argsort(values.astype(str), kind='stable')
+            if self._sort_descending:
+                self._order = self._order[::-1]
+    
+    def scroll(self, rows):
+        self._offset += rows
+        self._render()
+    
+    def _on_wheel(self, rows):
+        self.scroll(rows)
+        # The Treeview class bindings would otherwise scroll the items too
+        return "break"
+    
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self._offset = int(round(float(amount) * len(self._order)))
+        elif unit == 'pages':
+            self._offset += int(amount) * self._visible_rows
+        else:
+            self._offset += int(amount)
+        self._render()
+    
+    def _on_configure(self, event):
+        self._height = event.height
+        self._fit_rows()
+    
+    def _row_metrics(self):
+        # Row height and the offset of the first row below the headings, in
+        # pixels. Both are measured on the top item once it is displayed;
+        # until then the theme's row height is used for each.
+        if self._items:
+            bbox = self.tree.bbox(self._items[0])
+            if bbox:
+                self._measured = True
+                _, top, _, height = bbox
+                return height, top
+        try:
+            height = self.tree.winfo_pixels(ttk.Style().lookup('Treeview', 'rowheight') or DEFAULT_ROW_HEIGHT)
+        except tk.TclError:
+            height = DEFAULT_ROW_HEIGHT
+        return height, height
+    
+    def _fit_rows(self):
+        if self._height is None:
+            return
+        row_height, top = self._row_metrics()
+        visible_rows = max(1, (self._height - top) // max(1, row_height))
+        if visible_rows != self._visible_rows:
+            self._visible_rows = visible_rows
+            self._render()
+    
+    def _render(self):
+        total = len(self._order)
+        self._offset = max(0, min(self._offset, total - self._visible_rows))
+        window = self._order[self._offset:self._offset + self._visible_rows]
+        formatted = [[fmt.format(value) if not pd.isna(value) else '' for value in self._data[name][window]]
+                     for name, fmt in self.columns]
+        rows = list(zip(*formatted))
+        
+        # Reuse existing items and only touch the ones whose values changed
+        for slot, values in enumerate(rows):
+            if slot < len(self._items):
+                if self._shown[slot] != values:
+                    self.tree.item(self._items[slot], values=values)
+                    self._shown[slot] = values
+            else:
+                self._items.append(self.tree.insert('', 'end', values=values))
+                self._shown.append(values)
+        if len(self._items) > len(rows):
+            self.tree.delete(*self._items[len(rows):])
+            del self._items[len(rows):]
+            del self._shown[len(rows):]
+        
+        if total:
+            self.scrollbar.set(self._offset / total, (self._offset + len(rows)) / total)
+        else:
+            self.scrollbar.set(0, 1)
+        if rows and not self._measured:
+            # Fit the window again once the top item can be measured
+            self.tree.after_idle(self._fit_rows)
+
+
 class CovidAnalysisApp:
-    def __init__(self, root):
+    def __init__(self, root, data_file=None, startup_timer=None, profile=None):
         self.root = root
+        self.data_file = data_file
+        self.startup_timer = startup_timer
+        # Worker thread jobs go through profile.run(), so a COVID_PROFILE dump
+        # covers them as well as the Tk main thread
+        self.profile = profile or ProfileDump()
+        self._last_startup_mark = time.perf_counter()
         self.root.title("COVID-19 Death Rate Analysis")
         self.root.geometry("1200x800")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Background analysis state: one worker thread, only the latest request counts
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._request_id = 0
+        self._future = None
+        self._progress = ""
+        self._debounce_id = None
+        self._poll_id = None
+        self._refresh_future = None
         
-        # Load data
-        self.load_data()
+        # Data and results arrive after the window is shown; tab contents are
+        # built the first time each tab is displayed
+        self.ready = False
+        self.available_dates = []
+        self._results = None
+        self._stale_tabs = set()
+        self.hist_fig = None
+        self.scatter_fig = None
+        self.good_testing_table = None
+        self.trends_fig = None
+        self.sensitivity_fig = None
         
-        # Create UI
+        # Create UI and show it before anything heavy is imported or loaded
         self.create_ui()
+        self.status_var.set("Loading data...")
+        self.root.update_idletasks()
+        self._mark_startup('window')
         
-        # Initialize with default values
-        self.update_analysis()
+        # Load data on the worker thread so the window stays responsive
+        self._loading = self._executor.submit(self.profile.run, self.load_data)
+        self.root.after(POLL_MS, self._poll_loading)
     
     def load_data(self):
-        # Load the dataset
-        self.worldometer_df = pd.read_csv('worldometer_snapshots_April18_to_May18.csv')
-        self.available_dates = sorted(self.worldometer_df['Date'].unique().tolist())
+        # Runs on the worker thread: import the data modules, load the dataset,
+        # index its rows by date and compute derived metrics
+        _import_data_modules()
+        snapshots = covid_data.SnapshotIndex.from_csv(self.data_file or covid_data.DATA_FILE)
+        self.worldometer_df = snapshots.df
+        self.death_rate_query = covid_stats.DeathRateQuery(snapshots)
+        self.time_series = covid_stats.CountryTimeSeries.from_snapshots(snapshots)
+        self.snapshots = snapshots
+    
+    def _poll_loading(self):
+        if self._loading is not None and not self._loading.done():
+            self.root.after(POLL_MS, self._poll_loading)
+            return
+        self.finish_loading()
+    
+    def finish_loading(self):
+        """Wait for the background data load, then fill in the controls and
+        start the first analysis."""
+        if self._loading is None:
+            return
+        loading, self._loading = self._loading, None
+        try:
+            loading.result()
+        except Exception as e:
+            self.status_var.set(f"Could not load data: {e}")
+            return
+        self._mark_startup('load_data')
+        self.ready = True
+        self.available_dates = list(self.snapshots.dates)
+        self.date_combo.config(values=self.available_dates)
+        self.date_var.set(self.available_dates[-1])  # Default to last date
+        self._stale_tabs.add(TRENDS_TAB)
+        self.update_analysis()
         
+        # Watch the CSV for new daily snapshots
+        self.root.after(REFRESH_MS, self.check_for_new_data)
+    
+    def _mark_startup(self, stage):
+        # Startup measurement mode: time since the previous milestone
+        if self.startup_timer is None:
+            return
+        now = time.perf_counter()
+        self.startup_timer.add(stage, now - self._last_startup_mark)
+        self._last_startup_mark = now
+    
+    def _finish_startup_timing(self):
+        # Runs once the first analysis is on screen, then closes the window
+        self.root.update_idletasks()
+        self._mark_startup('first_render')
+        timer, self.startup_timer = self.startup_timer, None
+        print(f"Startup: {timer.summary()} (total {1000 * timer.total:.1f} ms)")
+        timer.record(data_file=self.data_file or covid_data.DATA_FILE)
+        self.root.after_idle(self.on_close)
+    
     def create_ui(self):
         # Create control panel frame
         control_frame = ttk.LabelFrame(self.root, text="Controls")
         control_frame.pack(fill="x", padx=10, pady=10)
         
-        # Date selection
+        # Date selection (filled in once the data has loaded)
         ttk.Label(control_frame, text="Select Date:").grid(row=0, column=0, padx=5, pady=5)
         self.date_var = tk.StringVar()
         self.date_combo = ttk.Combobox(control_frame, textvariable=self.date_var, values=self.available_dates)
         self.date_combo.grid(row=0, column=1, padx=5, pady=5)
-        self.date_combo.current(len(self.available_dates)-1)  # Default to last date
         self.date_combo.bind("<<ComboboxSelected>>", lambda e: self.update_analysis())
         
         # Minimum cases threshold
         ttk.Label(control_frame, text="Minimum Cases:").grid(row=0, column=2, padx=5, pady=5)
         self.min_cases_var = tk.IntVar(value=1000)
-        min_cases_scale = ttk.Scale(control_frame, from_=100, to=10000, variable=self.min_cases_var, 
+        min_cases_scale = ttk.Scale(control_frame, from_=100, to=10000, variable=self.min_cases_var,
                                orient="horizontal", length=200, command=lambda e: self.update_scale_label())
         min_cases_scale.grid(row=0, column=3, padx=5, pady=5)
         self.min_cases_label = ttk.Label(control_frame, text="1000")
@@ -52,7 +353,7 @@ class CovidAnalysisApp:
         # Testing quality threshold
         ttk.Label(control_frame, text="Testing Quality Threshold:").grid(row=1, column=2, padx=5, pady=5)
         self.testing_quality_var = tk.IntVar(value=50)
-        testing_quality_scale = ttk.Scale(control_frame, from_=5, to=100, variable=self.testing_quality_var, 
+        testing_quality_scale = ttk.Scale(control_frame, from_=5, to=100, variable=self.testing_quality_var,
                                      orient="horizontal", length=200, command=lambda e: self.update_scale_label())
         testing_quality_scale.grid(row=1, column=3, padx=5, pady=5)
         self.testing_quality_label = ttk.Label(control_frame, text="50")
@@ -63,9 +364,15 @@ class CovidAnalysisApp:
         update_button = ttk.Button(control_frame, text="Update Analysis", command=self.update_analysis)
         update_button.grid(row=1, column=1, padx=5, pady=5)
         
-        # Create tabs
+        # Live estimate, refreshed while the sliders are dragged
+        self.live_estimate_var = tk.StringVar()
+        ttk.Label(control_frame, textvariable=self.live_estimate_var,
+                  font=('Arial', 10, 'bold')).grid(row=2, column=0, columnspan=5, padx=5, pady=5, sticky="w")
+        
+        # Create tabs; their contents are rendered when first selected
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill="both", expand=True, padx=10, pady=10)
+        self.notebook.bind("<<NotebookTabChanged>>", lambda e: self._render_visible_tab())
         
         # Tab 1: Histogram
         self.histogram_frame = ttk.Frame(self.notebook)
@@ -83,145 +390,436 @@ class CovidAnalysisApp:
         self.results_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.results_frame, text="Results")
         
+        # Tab 5: Country Trends
+        self.trends_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.trends_frame, text="Country Trends")
+        
+        # Tab 6: Threshold Sensitivity
+        self.sensitivity_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.sensitivity_frame, text="Threshold Sensitivity")
+        
+        self._tab_renderers = {
+            HISTOGRAM_TAB: self.render_histogram_tab,
+            SCATTER_TAB: self.render_scatter_tab,
+            GOOD_TESTING_TAB: self.render_good_testing_tab,
+            RESULTS_TAB: self.render_results_tab,
+            TRENDS_TAB: self.render_trends_tab,
+            SENSITIVITY_TAB: self.render_sensitivity_tab,
+        }
+        
         # Status bar
         self.status_var = tk.StringVar()
         self.status_bar = ttk.Label(self.root, textvariable=self.status_var, relief="sunken", anchor="w")
         self.status_bar.pack(fill="x", side="bottom", padx=10, pady=5)
+    
+    def _render_visible_tab(self):
+        # Only the selected tab is drawn; tabs whose inputs changed while
+        # hidden are marked stale and catch up when they are selected
+        index = self.notebook.index('current')
+        if index in self._stale_tabs:
+            self._stale_tabs.discard(index)
+            self._tab_renderers[index]()
+    
+    def create_histogram_plot(self):
+        # Figures are created once and updated in place by the tab renderers.
+        # They are plain Figure objects, so pyplot never holds on to them.
+        _import_plot_modules()
+        bins = np.arange(35)
+        
+        # Histogram: one bar per bin whose heights are replaced on update
+        self.hist_fig = Figure(figsize=(10, 6))
+        self.hist_ax = self.hist_fig.add_subplot()
+        self.hist_bars = self.hist_ax.bar(bins[:-1], np.zeros(len(bins) - 1), width=1, align='edge')
+        self.hist_ax.set_xlabel('Death Rate (%)', fontsize=14)
+        self.hist_ax.set_ylabel('Number of Countries', fontsize=14)
+        self.hist_canvas = FigureCanvasTkAgg(self.hist_fig, self.histogram_frame)
+        self.hist_empty_label = ttk.Label(self.histogram_frame, text="No data available for the selected criteria")
+    
+    def create_scatter_plot(self):
+        # Scatter: one collection whose offsets, sizes and colours are replaced
+        _import_plot_modules()
+        self.scatter_fig = Figure(figsize=(10, 6))
+        self.scatter_ax = self.scatter_fig.add_subplot()
+        self.scatter = self.scatter_ax.scatter(x=[], y=[], s=[], c=[], cmap='viridis')
+        self.scatter.set_clim(0, 1)
+        self.scatter_fig.colorbar(self.scatter, ax=self.scatter_ax)
+        self.scatter_ax.set_ylabel('Death Rate (%)', fontsize=14)
+        self.scatter_ax.set_xlabel('Number of Tests per Positive Case', fontsize=14)
+        self.scatter_ax.set_title('Death Rate as function of Testing Quality', fontsize=16)
+        self.scatter_ax.set_xlim(-1, covid_data.X_AXIS_LIMIT + 12)
+        self.scatter_ax.set_ylim(-0.2,17)
+        self.scatter_labels = {
+            country_name: self.scatter_ax.annotate(country_name, xy=(0, 0), xytext=(5, 0),
+                                                   textcoords='offset points', fontsize=10,
+                                                   visible=False)
+            for country_name in countries_to_display
+        }
+        self.scatter_canvas = FigureCanvasTkAgg(self.scatter_fig, self.scatter_frame)
+        self.scatter_empty_label = ttk.Label(self.scatter_frame, text="No data available for the selected criteria")
+    
+    def create_good_testing_tab(self):
+        self.good_testing_table = VirtualTable(self.good_testing_frame, good_testing_columns)
+        self.good_testing_estimate_label = ttk.Label(self.good_testing_frame, font=('Arial', 12, 'bold'))
+        self.good_testing_empty_label = ttk.Label(self.good_testing_frame, text="No countries meet the selected testing quality threshold. Try adjusting the filters.")
+    
+    def create_trends_tab(self):
+        _import_plot_modules()
         
+        # Country picker
+        trends_controls = ttk.Frame(self.trends_frame)
+        trends_controls.pack(fill="x", padx=10, pady=5)
+        ttk.Label(trends_controls, text="Country:").pack(side="left", padx=5)
+        countries = list(self.time_series.countries)
+        self.trend_country_var = tk.StringVar(value='USA' if 'USA' in countries else countries[0])
+        self.trend_combo = ttk.Combobox(trends_controls, textvariable=self.trend_country_var, values=countries)
+        self.trend_combo.pack(side="left", padx=5)
+        self.trend_combo.bind("<<ComboboxSelected>>", lambda e: self.update_trends())
+        
+        # One figure with a panel per metric; the lines are updated in place
+        empty = np.full(len(self.time_series.dates), np.nan)
+        x = np.arange(len(empty))
+        self.trends_fig = Figure(figsize=(10, 6))
+        axes = self.trends_fig.subplots(3, 1, sharex=True)
+        self.trends_axes = axes
+        self.trend_lines = {
+            'New Cases': axes[0].plot(x, empty, label='New Cases')[0],
+            'New Deaths': axes[0].plot(x, empty, label='New Deaths')[0],
+            'Rolling CFR (%)': axes[1].plot(x, empty, color='tab:red', label='Rolling CFR (%)')[0],
+            'Tests per Positive Case': axes[2].plot(x, empty, label='Cumulative')[0],
+            'Rolling Tests per Positive': axes[2].plot(x, empty, label='Rolling')[0],
+        }
+        axes[0].set_title(' ', fontsize=14)  # Reserve room for the country title
+        axes[0].set_ylabel('Daily Count')
+        axes[0].set_yscale('symlog')
+        axes[1].set_ylabel(f'{self.time_series.window}-Day CFR (%)')
+        axes[2].set_ylabel('Tests per Positive')
+        for ax in axes:
+            ax.legend(loc='upper left', fontsize=8)
+        self.trends_fig.tight_layout()
+        self.trends_canvas = FigureCanvasTkAgg(self.trends_fig, self.trends_frame)
+        self.trends_canvas.get_tk_widget().pack(fill="both", expand=True)
+    
+    def create_sensitivity_plot(self):
+        # Heatmaps of the estimate and of the number of good testing countries
+        # over the sweep grid, with the current slider position marked
+        _import_plot_modules()
+        min_cases = covid_stats.SWEEP_MIN_CASES
+        thresholds = covid_stats.SWEEP_THRESHOLDS
+        min_step = min_cases[1] - min_cases[0]
+        threshold_step = thresholds[1] - thresholds[0]
+        extent = (thresholds[0] - threshold_step / 2, thresholds[-1] + threshold_step / 2,
+                  min_cases[0] - min_step / 2, min_cases[-1] + min_step / 2)
+        empty = np.full((len(min_cases), len(thresholds)), np.nan)
+        
+        self.sensitivity_fig = Figure(figsize=(10, 6))
+        axes = self.sensitivity_fig.subplots(1, 2, sharey=True)
+        self.sensitivity_images = []
+        self.sensitivity_markers = []
+        for ax, title in zip(axes, ['Estimated Death Rate (%)', 'Good Testing Countries']):
+            image = ax.imshow(empty, origin='lower', aspect='auto', extent=extent, cmap='viridis')
+            self.sensitivity_fig.colorbar(image, ax=ax)
+            ax.set_title(title, fontsize=12)
+            ax.set_xlabel('Testing Quality Threshold')
+            self.sensitivity_images.append(image)
+            self.sensitivity_markers.append(ax.plot([], [], marker='x', color='red', markersize=10,
+                                                    linestyle='none')[0])
+        axes[0].set_ylabel('Minimum Cases')
+        self.sensitivity_fig.suptitle(' ', fontsize=14)  # Reserve room for the date title
+        self.sensitivity_fig.tight_layout()
+        self.sensitivity_canvas = FigureCanvasTkAgg(self.sensitivity_fig, self.sensitivity_frame)
+        self.sensitivity_canvas.get_tk_widget().pack(fill="both", expand=True)
+    
+    def render_sensitivity_tab(self):
+        results = self._results
+        if self.sensitivity_fig is None:
+            self.create_sensitivity_plot()
+        sweep = results['sweep']
+        with results['timer'].span('show_sweep'):
+            for image, values in zip(self.sensitivity_images, (sweep.death_rate[0], sweep.countries[0])):
+                image.set_data(values)
+                finite = values[np.isfinite(values)]
+                image.set_clim(*((finite.min(), finite.max()) if len(finite) else (0, 1)))
+            for marker in self.sensitivity_markers:
+                marker.set_data([results['testing_quality']], [results['min_cases']])
+            self.sensitivity_fig.suptitle(f"Threshold sensitivity on {results['selected_date']}", fontsize=14)
+            self.sensitivity_canvas.draw_idle()
+    
+    def render_trends_tab(self):
+        if self.trends_fig is None:
+            self.create_trends_tab()
+        else:
+            self.trend_combo.config(values=list(self.time_series.countries))
+        self.update_trends()
+    
+    def update_trends(self):
+        # All metrics are precomputed for every country, so this is a row lookup
+        country = self.trend_country_var.get()
+        if country not in self.time_series.countries:
+            return
+        country_df = self.time_series.country_frame(country)
+        dates = list(country_df.index)  # Consistent with the rows even if a sync is running
+        x = np.arange(len(dates))
+        for name, line in self.trend_lines.items():
+            line.set_data(x, country_df[name].to_numpy())
+        tick_positions = x[::max(1, len(dates) // 6)]
+        self.trends_axes[2].set_xticks(tick_positions)
+        self.trends_axes[2].set_xticklabels([dates[i] for i in tick_positions])
+        for ax in self.trends_axes:
+            ax.relim()
+            ax.autoscale_view()
+        self.trends_axes[0].set_title(f'{country}: daily trends', fontsize=14)
+        self.trends_canvas.draw_idle()
+    
+    def _show_plot(self, canvas, empty_label, has_data):
+        # Swap between the figure and the "no data" message without recreating either
+        canvas_widget = canvas.get_tk_widget()
+        if has_data:
+            empty_label.pack_forget()
+            canvas_widget.pack(fill="both", expand=True)
+            canvas.draw_idle()
+        else:
+            canvas_widget.pack_forget()
+            empty_label.pack(padx=20, pady=20)
+    
     def update_scale_label(self):
         self.min_cases_label.config(text=str(self.min_cases_var.get()))
         self.testing_quality_label.config(text=str(self.testing_quality_var.get()))
-        
+        self.update_live_estimate()
+    
+    def update_live_estimate(self):
+        selected_date = self.date_var.get()
+        if not self.ready or selected_date not in self.snapshots:
+            return
+        estimate = self.death_rate_query.estimate(selected_date, self.min_cases_var.get(),
+                                                  self.testing_quality_var.get())
+        if estimate.cases > 0:
+            self.live_estimate_var.set(f"Estimated death rate: {estimate.death_rate:.2f}% "
+                                       f"({estimate.countries} countries with good testing)")
+        else:
+            self.live_estimate_var.set("Estimated death rate: no countries meet the thresholds")
+    
     def update_analysis(self):
-        self.status_var.set("Analyzing data...")
-        self.root.update_idletasks()
+        # Debounce: every request restarts the timer, so a burst of slider and
+        # combobox events results in a single analysis
+        if self._debounce_id is not None:
+            self.root.after_cancel(self._debounce_id)
+        self._debounce_id = self.root.after(DEBOUNCE_MS, self._start_analysis)
+    
+    def _start_analysis(self):
+        self._debounce_id = None
+        if not self.ready:
+            return  # finish_loading starts the first analysis
         
         # Get selected values
         selected_date = self.date_var.get()
         min_cases = self.min_cases_var.get()
         testing_quality = self.testing_quality_var.get()
         
-        # Filter data based on selected date
-        date_df = self.worldometer_df.loc[self.worldometer_df['Date'] == selected_date, :].reset_index(drop=True)
-        
-        # Calculate death rate
-        date_df['Case Fatality Ratio'] = date_df['Total Deaths'] / date_df['Total Cases']
-        date_df['Num Tests per Positive Case'] = date_df['Total Tests'] / date_df['Total Cases']
-        
-        # Filter countries by case threshold
-        filtered_df = date_df.loc[date_df['Total Cases'] > min_cases, :].copy()
+        # Newer requests make older ones stale; a queued one is dropped outright
+        self._request_id += 1
+        if self._future is not None:
+            self._future.cancel()
+        self._progress = "Analyzing data..."
+        self.status_var.set(self._progress)
+        self._future = self._executor.submit(self.profile.run, self._compute_analysis, self._request_id,
+                                             selected_date, min_cases, testing_quality)
+        if self._poll_id is None:
+            self._poll_id = self.root.after(POLL_MS, self._poll_analysis)
+    
+    def _set_progress(self, request_id, message):
+        # Called from the worker thread between stages
+        if request_id != self._request_id:
+            raise StaleAnalysis()
+        self._progress = message
+    
+    def _compute_analysis(self, request_id, selected_date, min_cases, testing_quality):
+        # Runs on the worker thread: no Tk or pyplot calls in here
+        timer = StageTimer('gui_update')
+        self._set_progress(request_id, f"Filtering data for {selected_date}...")
         
-        # Update Histogram Tab
-        for widget in self.histogram_frame.winfo_children():
-            widget.destroy()
-            
-        if not filtered_df.empty:
-            # Create histogram
-            fig1, ax1 = plt.subplots(figsize=(10, 6))
-            ax1.hist(100 * np.array(filtered_df['Case Fatality Ratio']), bins=np.arange(35))
-            ax1.set_xlabel('Death Rate (%)', fontsize=14)
-            ax1.set_ylabel('Number of Countries', fontsize=14)
-            ax1.set_title(f'Histogram of Death Rates (Countries with >{min_cases} cases)', fontsize=16)
+        with timer.span('filter'):
+            # Look up the rows for the selected date (derived metrics are precomputed)
+            date_df = self.snapshots.get_date(selected_date)
             
-            canvas1 = FigureCanvasTkAgg(fig1, self.histogram_frame)
-            canvas1.draw()
-            canvas1.get_tk_widget().pack(fill="both", expand=True)
-        else:
-            ttk.Label(self.histogram_frame, text="No data available for the selected criteria").pack(padx=20, pady=20)
+            # Filter countries by case threshold
+            filtered_df = date_df.loc[date_df['Total Cases'] > min_cases, :]
         
-        # Update Scatter Plot Tab
-        for widget in self.scatter_frame.winfo_children():
-            widget.destroy()
-            
-        if not filtered_df.empty:
-            # Calculate parameters for scatter plot
-            x_axis_limit = 80
-            
-            # Prepare data
-            death_rate_percent = 100 * np.array(filtered_df['Case Fatality Ratio'])
-            num_test_per_positive = np.array(filtered_df['Num Tests per Positive Case'])
-            num_test_per_positive[num_test_per_positive > x_axis_limit] = x_axis_limit
-            total_num_deaths = np.array(filtered_df['Total Deaths'])
-            population = np.array(filtered_df['Population'])
-            
-            # Create scatter plot
-            fig2, ax2 = plt.subplots(figsize=(10, 6))
-            scatter = ax2.scatter(x=num_test_per_positive, y=death_rate_percent, 
-                              s=0.5*np.power(np.log(1+population),2), 
-                              c=np.log10(1+total_num_deaths), cmap='viridis')
-            
-            plt.colorbar(scatter, ax=ax2)
-            ax2.set_ylabel('Death Rate (%)', fontsize=14)
-            ax2.set_xlabel('Number of Tests per Positive Case', fontsize=14)
-            ax2.set_title('Death Rate as function of Testing Quality', fontsize=16)
-            ax2.set_xlim(-1, x_axis_limit + 12)
-            ax2.set_ylim(-0.2,17)
+        self._set_progress(request_id, "Computing histogram...")
+        with timer.span('histogram'):
+            death_rates = filtered_df['Death Rate (%)'].to_numpy()
+            hist_counts, _ = np.histogram(death_rates[~np.isnan(death_rates)], bins=np.arange(35))
+        
+        self._set_progress(request_id, "Preparing scatter plot...")
+        with timer.span('scatter'):
+            death_rate_percent = filtered_df['Death Rate (%)'].to_numpy()
+            num_test_per_positive = filtered_df['Tests Per Case'].to_numpy()
             
             # Add country labels for selected countries
-            countries_to_display = ['USA', 'Russia', 'Spain', 'Brazil', 'UK', 'Italy', 'France', 
-                                'Germany', 'India', 'Canada', 'Belgium', 'Mexico', 'Netherlands']
-            
-            for country_name in countries_to_display:
-                country_indices = filtered_df.index[filtered_df['Country'] == country_name].tolist()
-                if country_indices:  # Check if the country exists in the dataframe
-                    country_index = country_indices[0]
-                    ax2.annotate(country_name, 
-                             xy=(num_test_per_positive[country_index], death_rate_percent[country_index]),
-                             xytext=(5, 0), textcoords='offset points', fontsize=10)
-            
-            canvas2 = FigureCanvasTkAgg(fig2, self.scatter_frame)
-            canvas2.draw()
-            canvas2.get_tk_widget().pack(fill="both", expand=True)
-        else:
-            ttk.Label(self.scatter_frame, text="No data available for the selected criteria").pack(padx=20, pady=20)
+            positions = covid_plots.label_positions(filtered_df['Country'].to_numpy(dtype=object),
+                                                    countries_to_display)
+            labels = [(country_name, num_test_per_positive[country_index], death_rate_percent[country_index])
+                      for country_name, country_index in positions.items()]
         
-        # Update Good Testing Countries Tab
-        for widget in self.good_testing_frame.winfo_children():
-            widget.destroy()
-            
-        # Filter for good testing countries
-        good_testing_df = filtered_df.loc[filtered_df['Num Tests per Positive Case'] > testing_quality, :].copy()
+        self._set_progress(request_id, "Selecting good testing countries...")
+        with timer.span('good_testing'):
+            good_testing_df = filtered_df.loc[filtered_df['Num Tests per Positive Case'] > testing_quality, :]
+            estimate = self.death_rate_query.estimate(selected_date, min_cases, testing_quality)
+            table_columns = {
+                'Country': good_testing_df['Country'].to_numpy(),
+                'Total Cases': good_testing_df['Total Cases'].to_numpy(dtype=float, na_value=np.nan),
+                'Total Deaths': good_testing_df['Total Deaths'].to_numpy(dtype=float, na_value=np.nan),
+                'Total Tests': good_testing_df['Total Tests'].to_numpy(dtype=float, na_value=np.nan),
+                'Tests/Case': good_testing_df['Num Tests per Positive Case'].to_numpy(),
+                'Death Rate (%)': good_testing_df['Death Rate (%)'].to_numpy(),
+            }
         
-        if not good_testing_df.empty:
-            # Create table with good testing countries
-            columns = ('Country', 'Total Cases', 'Total Deaths', 'Total Tests', 'Tests/Case', 'Death Rate (%)')
-            tree = ttk.Treeview(self.good_testing_frame, columns=columns, show='headings')
-            
-            for col in columns:
-                tree.heading(col, text=col)
-                tree.column(col, width=100)
-            
-            for i, row in good_testing_df.iterrows():
-                tree.insert('', 'end', values=(
-                    row['Country'],
-                    int(row['Total Cases']),
-                    int(row['Total Deaths']),
-                    int(row['Total Tests']),
-                    round(row['Num Tests per Positive Case'], 2),
-                    round(100 * row['Case Fatality Ratio'], 2)
-                ))
-            
-            tree.pack(fill="both", expand=True, padx=10, pady=10)
-            
-            # Calculate the estimated death rate for good testing countries
-            if good_testing_df['Total Cases'].sum() > 0:  # Avoid division by zero
-                estimated_death_rate = 100 * good_testing_df['Total Deaths'].sum() / good_testing_df['Total Cases'].sum()
-                ttk.Label(self.good_testing_frame, 
-                      text=f"Estimated COVID-19 Death Rate (countries with good testing): {estimated_death_rate:.2f}%",
-                      font=('Arial', 12, 'bold')).pack(padx=20, pady=20)
-        else:
-            ttk.Label(self.good_testing_frame, text="No countries meet the selected testing quality threshold. Try adjusting the filters.").pack(padx=20, pady=20)
+        with timer.span('bootstrap'):
+            interval = self.death_rate_query.confidence_interval(selected_date, min_cases, testing_quality)
+        
+        self._set_progress(request_id, "Sweeping thresholds...")
+        with timer.span('sweep'):
+            sweep = covid_stats.threshold_sweep(self.snapshots, [selected_date])
+        
+        self._set_progress(request_id, "Rendering results...")
+        return {
+            'request_id': request_id,
+            'selected_date': selected_date,
+            'min_cases': min_cases,
+            'testing_quality': testing_quality,
+            'num_filtered': len(filtered_df),
+            'num_good_testing': len(good_testing_df),
+            'hist_counts': hist_counts,
+            'scatter_x': num_test_per_positive,
+            'scatter_y': death_rate_percent,
+            'scatter_sizes': 0.5*np.power(filtered_df['Log Population'].to_numpy(),2),
+            'scatter_colors': filtered_df['Log Deaths'].to_numpy(),
+            'labels': labels,
+            'table_columns': table_columns,
+            'estimate': estimate,
+            'interval': interval,
+            'sweep': sweep,
+            'timer': timer,
+        }
+    
+    def _poll_analysis(self):
+        # Runs on the Tk main loop until the latest request has finished
+        self._poll_id = None
+        future = self._future
+        if future is None:
+            return
+        if not future.done():
+            self.status_var.set(self._progress)
+            self._poll_id = self.root.after(POLL_MS, self._poll_analysis)
+            return
+        
+        self._future = None
+        try:
+            results = future.result()
+        except (CancelledError, StaleAnalysis):
+            return
+        except Exception as e:
+            self.status_var.set(f"Analysis failed: {e}")
+            return
+        if results['request_id'] != self._request_id:
+            return  # A newer request is on its way
+        self._show_results(results)
+    
+    def _show_results(self, results):
+        # Every analysis tab is now out of date, but only the visible one is redrawn
+        self._results = results
+        self._stale_tabs.update(ANALYSIS_TABS)
+        self._render_visible_tab()
+        
+        selected_date = results['selected_date']
+        min_cases = results['min_cases']
+        testing_quality = results['testing_quality']
+        timer = results['timer']
+        self.update_live_estimate()
+        status = f"Analysis completed for {selected_date} | Min Cases: {min_cases} | Testing Quality: {testing_quality}"
+        if timer.enabled:
+            # Canvas redraws are queued as idle callbacks, so run them here to time them
+            with timer.span('draw'):
+                self.root.update_idletasks()
+            status += f" | {timer.summary()}"
+            timer.record(date=selected_date, min_cases=min_cases, testing_quality=testing_quality)
+        self.status_var.set(status)
+        if self.startup_timer is not None:
+            self._finish_startup_timing()
+    
+    def render_histogram_tab(self):
+        results = self._results
+        if self.hist_fig is None:
+            self.create_histogram_plot()
+        with results['timer'].span('show_histogram'):
+            if results['num_filtered']:
+                for bar, count in zip(self.hist_bars, results['hist_counts']):
+                    bar.set_height(count)
+                self.hist_ax.relim()
+                self.hist_ax.autoscale_view()
+                self.hist_ax.set_title(f"Histogram of Death Rates (Countries with >{results['min_cases']} cases)", fontsize=16)
+            self._show_plot(self.hist_canvas, self.hist_empty_label, results['num_filtered'])
+    
+    def render_scatter_tab(self):
+        results = self._results
+        if self.scatter_fig is None:
+            self.create_scatter_plot()
+        with results['timer'].span('show_scatter'):
+            if results['num_filtered']:
+                self.scatter.set_offsets(np.column_stack([results['scatter_x'], results['scatter_y']]))
+                self.scatter.set_sizes(results['scatter_sizes'])
+                self.scatter.set_array(results['scatter_colors'])
+                self.scatter.autoscale()
+                
+                # Move the labels of the selected countries, hide the rest
+                label_positions = {country_name: (x, y) for country_name, x, y in results['labels']}
+                for country_name, annotation in self.scatter_labels.items():
+                    position = label_positions.get(country_name)
+                    if position is not None:
+                        annotation.xy = position
+                    annotation.set_visible(position is not None)
+            self._show_plot(self.scatter_canvas, self.scatter_empty_label, results['num_filtered'])
+    
+    def render_good_testing_tab(self):
+        results = self._results
+        estimate = results['estimate']
+        if self.good_testing_table is None:
+            self.create_good_testing_tab()
+        with results['timer'].span('show_table'):
+            if results['num_good_testing']:
+                table_columns = results['table_columns']
+                self.good_testing_table.set_data(table_columns['Country'], table_columns)
+                self.good_testing_empty_label.pack_forget()
+                self.good_testing_table.frame.pack(fill="both", expand=True, padx=10, pady=10)
+                
+                # Show the estimated death rate for good testing countries
+                if estimate.cases > 0:  # Avoid division by zero
+                    self.good_testing_estimate_label.config(
+                        text=f"Estimated COVID-19 Death Rate (countries with good testing): {estimate.death_rate:.2f}%")
+                    self.good_testing_estimate_label.pack(padx=20, pady=20)
+                else:
+                    self.good_testing_estimate_label.pack_forget()
+            else:
+                self.good_testing_table.frame.pack_forget()
+                self.good_testing_estimate_label.pack_forget()
+                self.good_testing_empty_label.pack(padx=20, pady=20)
+    
+    def render_results_tab(self):
+        results = self._results
+        selected_date = results['selected_date']
+        min_cases = results['min_cases']
+        testing_quality = results['testing_quality']
+        estimate = results['estimate']
+        interval = results['interval']
         
-        # Update Results Tab
         for widget in self.results_frame.winfo_children():
             widget.destroy()
-            
+        
         result_text = f"""
         Analysis Results:
         
         Date: {selected_date}
-        Countries with more than {min_cases} cases: {len(filtered_df)}
-        Countries with testing quality > {testing_quality}: {len(good_testing_df)}
+        Countries with more than {min_cases} cases: {results['num_filtered']}
+        Countries with testing quality > {testing_quality}: {results['num_good_testing']}
         
         Conclusions:
         
@@ -231,16 +829,80 @@ class CovidAnalysisApp:
            countries with better testing tend to have more consistent and lower death rates
         """
         
-        if not good_testing_df.empty and good_testing_df['Total Cases'].sum() > 0:
-            estimated_death_rate = 100 * good_testing_df['Total Deaths'].sum() / good_testing_df['Total Cases'].sum()
-            result_text += f"\n4. The most accurate estimate of the COVID-19 death rate comes from countries with good testing (>{testing_quality} tests per positive case), which is approximately {estimated_death_rate:.2f}%"
+        if estimate.cases > 0:
+            result_text += f"\n4. The most accurate estimate of the COVID-19 death rate comes from countries with good testing (>{testing_quality} tests per positive case), which is approximately {estimate.death_rate:.2f}%"
+            result_text += (f"\n   {interval.confidence:.0%} confidence interval (bootstrap over {estimate.countries} countries, "
+                            f"{interval.resamples} resamples): {interval.low:.2f}% to {interval.high:.2f}%")
         
         results_label = ttk.Label(self.results_frame, text=result_text, justify='left', font=('Arial', 12))
         results_label.pack(fill="both", expand=True, padx=20, pady=20)
+    
+    def check_for_new_data(self):
+        # Pick up days appended to the CSV (e.g. by `python covid_data.py --append`).
+        # The refresh runs on the worker thread, queued behind any analysis, so
+        # it neither blocks the window nor changes the snapshots under an analysis
+        self._refresh_future = self._executor.submit(self.profile.run, self._refresh_data)
+        self.root.after(POLL_MS, self._poll_refresh)
+    
+    def _refresh_data(self):
+        # Runs on the worker thread
+        new_dates = self.snapshots.refresh()
+        if new_dates:
+            self.time_series.sync(self.snapshots)
+        return new_dates
+    
+    def _poll_refresh(self):
+        future = self._refresh_future
+        if future is None:
+            return
+        if not future.done():
+            self.root.after(POLL_MS, self._poll_refresh)
+            return
         
-        self.status_var.set(f"Analysis completed for {selected_date} | Min Cases: {min_cases} | Testing Quality: {testing_quality}")
+        self._refresh_future = None
+        try:
+            new_dates = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            # Keep watching: the file may be fixed before the next check
+            self.status_var.set(f"Could not load new data: {e}")
+            new_dates = []
+        if new_dates:
+            self.available_dates = list(self.snapshots.dates)
+            self.date_combo.config(values=self.available_dates)
+            self._stale_tabs.add(TRENDS_TAB)
+            self._render_visible_tab()
+            self.status_var.set(f"Loaded new data for {', '.join(new_dates)}")
+        self.root.after(REFRESH_MS, self.check_for_new_data)
+    
+    def on_close(self):
+        # Drop any pending work so the worker thread does not keep the process alive
+        for future in (self._future, self._refresh_future):
+            if future is not None:
+                future.cancel()
+        self._request_id += 1
+        self._executor.shutdown(wait=False)
+        self.root.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="COVID-19 death rate analysis GUI")
+    parser.add_argument('--startup-timing', action='store_true',
+                        help="Print how long each startup stage took, up to the first "
+                             "rendered analysis, then exit")
+    args = parser.parse_args()
+    startup_timer = StageTimer('gui_startup', enabled=args.startup_timing)
+    startup_timer.add('imports', time.perf_counter() - _MODULE_START)
+
+    # COVID_PROFILE=path writes a cProfile dump of the Tk main thread and the
+    # worker thread on exit
+    with ProfileDump() as profile:
+        with startup_timer.span('tk_init'):
+            root = tk.Tk()
+        app = CovidAnalysisApp(root, startup_timer=startup_timer if args.startup_timing else None,
+                               profile=profile)
+        root.mainloop()
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = CovidAnalysisApp(root)
-    root.mainloop() 
\ No newline at end of file
+    main()